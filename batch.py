@@ -0,0 +1,276 @@
+"""
+Headless batch renderer.
+
+    python main.py render --mappings preset.json --in a.mp4 --out b.mp4
+    python main.py render --mappings preset.json --in clips/ "more/*.mov" --out rendered/
+    python main.py bench-decode clip.mp4 --threads 4
+    python main.py bench-transform --size 3840x2160 --count 10 --tiles 0
+
+Uses the same mapping pipeline and export engine as Apply & Save, but never
+imports PyQt5, so it runs on machines without a display.
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from color_engine import DEFAULT_ENGINE, ENGINES, benchmark_engines, choose_tiles
+from export import export_video
+from presets import load_pipeline
+from video_io import (DECODERS, DEFAULT_DECODER, DEFAULT_ENCODER_PRESET, ENCODER_PRESETS, ENCODERS,
+                      benchmark_decoders, output_extension)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+# Exit codes
+EXIT_OK = 0
+EXIT_RENDER_FAILED = 1
+EXIT_USAGE = 2
+
+
+def expand_inputs(patterns):
+    """Expands files, directories and glob patterns into a sorted list of videos."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(
+                os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(p for p in glob.glob(pattern) if os.path.isfile(p)))
+        else:
+            paths.append(pattern)
+
+    # Keep the first occurrence of anything matched twice
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def output_path(src_path, out, many, extension=".mp4"):
+    # With several inputs --out is a directory that mirrors the input names
+    if many or os.path.isdir(out):
+        return os.path.join(out, os.path.splitext(os.path.basename(src_path))[0] + extension)
+    return out
+
+
+def render_one(src_path, dst_path, pipeline, workers, transform_threads, options, timings=False):
+    stats = export_video(src_path, dst_path, pipeline, workers=workers,
+                         transform_threads=transform_threads, **options)
+    if timings:
+        return f"{stats}\n{stats.timing_summary()}"
+    return str(stats)
+
+
+def encoder_settings(args):
+    # Start from the named preset and apply whatever was set explicitly
+    settings = ENCODER_PRESETS[args.encoder_preset]
+    overrides = {field: getattr(args, field) for field in settings._fields
+                 if getattr(args, field) is not None}
+    return settings._replace(**overrides)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py render", description="Render videos with a mapping preset.")
+    parser.add_argument("--mappings", required=True,
+                        help="JSON or compiled binary preset with the color mappings")
+    parser.add_argument("--in", dest="inputs", nargs="+", required=True,
+                        help="input videos, directories or glob patterns")
+    parser.add_argument("--out", required=True,
+                        help="output file, or output directory when there are several inputs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--decoder", choices=sorted(DECODERS), default=DEFAULT_DECODER,
+                        help=f"decode backend (default: {DEFAULT_DECODER})")
+    parser.add_argument("--decode-threads", type=int, default=None,
+                        help="decoder threads per worker (default: chosen by the backend)")
+    parser.add_argument("--no-passthrough", dest="passthrough", action="store_false",
+                        help="drop the audio, subtitle and metadata tracks instead of copying them")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help=f"transform engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument("--skip-untouched", action="store_true",
+                        help="stream-copy GOPs the mappings leave unchanged and re-encode only the rest "
+                             "(needs an H.264 source and the libx264 encoder)")
+    parser.add_argument("--encoder-preset", choices=sorted(ENCODER_PRESETS), default=DEFAULT_ENCODER_PRESET,
+                        help=f"encoder settings to start from (default: {DEFAULT_ENCODER_PRESET})")
+    parser.add_argument("--encoder", choices=sorted(ENCODERS) + ["auto"],
+                        help="encode backend; auto uses ffmpeg when it is installed")
+    parser.add_argument("--codec", help="ffmpeg video codec, e.g. libx264, libx265 or ffv1")
+    parser.add_argument("--preset", help="x264/x265 speed preset, e.g. ultrafast or medium")
+    parser.add_argument("--crf", type=int, help="x264/x265 constant rate factor (lower is better)")
+    parser.add_argument("--encode-threads", dest="threads", type=int,
+                        help="encoder threads per worker (default: the worker's share of the cores)")
+    parser.add_argument("--timings", action="store_true",
+                        help="also print the per-frame p50/p95/max time of each stage")
+    return parser
+
+
+def build_bench_parser():
+    parser = argparse.ArgumentParser(prog="main.py bench-decode",
+                                     description="Compare the decode throughput of the backends.")
+    parser.add_argument("video", help="video file to decode")
+    parser.add_argument("--decoders", nargs="+", choices=sorted(DECODERS), default=None,
+                        help="backends to run (default: all)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="decoder threads (default: chosen by the backend)")
+    parser.add_argument("--frames", type=int, default=None,
+                        help="stop after this many frames (default: the whole file)")
+    return parser
+
+
+def build_bench_transform_parser():
+    parser = argparse.ArgumentParser(prog="main.py bench-transform",
+                                     description="Compare the transform engines on random frames.")
+    parser.add_argument("--size", default="1920x1080", help="frame size as WIDTHxHEIGHT (default: 1920x1080)")
+    parser.add_argument("--mappings", help="preset to benchmark (default: --count random mappings)")
+    parser.add_argument("--count", type=int, default=10, help="number of random mappings (default: 10)")
+    parser.add_argument("--frames", type=int, default=10, help="frames per run (default: 10)")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=None,
+                        help="engines to run (default: all)")
+    parser.add_argument("--tiles", type=int, default=1,
+                        help="strips each frame is split into across threads; 0 picks them from the "
+                             "core count and frame size (default: 1)")
+    return parser
+
+
+def random_mappings(count, rng):
+    # Boxes of random size and position, so they overlap the way hand-made
+    # mappings tend to
+    mappings = []
+    for _ in range(count):
+        a, b = rng.integers(0, 256, (2, 3))
+        mappings.append((np.minimum(a, b), np.maximum(a, b), rng.integers(0, 256, 3)))
+    return mappings
+
+
+def bench_transform_main(argv=None):
+    args = build_bench_transform_parser().parse_args(argv)
+    try:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+    except ValueError:
+        print(f"error: invalid size: {args.size}", file=sys.stderr)
+        return EXIT_USAGE
+
+    rng = np.random.default_rng(0)
+    if args.mappings:
+        try:
+            mappings = load_pipeline(args.mappings).mappings
+        except (OSError, ValueError) as e:
+            print(f"error: could not load mappings: {e}", file=sys.stderr)
+            return EXIT_USAGE
+    else:
+        mappings = random_mappings(args.count, rng)
+    frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(max(1, args.frames))]
+
+    failed = 0
+    tiles = args.tiles if args.tiles > 0 else None
+    print(f"{width}x{height}, {len(mappings)} mappings, {len(frames)} frames, "
+          f"{min(tiles or choose_tiles(frames[0].shape), height)} tiles")
+    for result in benchmark_engines(frames, mappings, args.engines, tiles=tiles):
+        if "error" in result:
+            print(f"{result['engine']:>8}: unavailable: {result['error']}")
+            continue
+        if not result["matches"]:
+            failed += 1
+        print(f"{result['engine']:>8}: {result['fps']:.1f} fps, compiled in {result['compile_ms']:.1f} ms"
+              f"{'' if result['matches'] else ', OUTPUT DIFFERS FROM THE LOOP'}")
+    return EXIT_RENDER_FAILED if failed else EXIT_OK
+
+
+def bench_main(argv=None):
+    args = build_bench_parser().parse_args(argv)
+    if not os.path.isfile(args.video):
+        print(f"error: no such file: {args.video}", file=sys.stderr)
+        return EXIT_USAGE
+
+    failed = 0
+    for result in benchmark_decoders(args.video, args.decoders, args.threads, args.frames):
+        if result.get("unavailable"):
+            print(f"{result['decoder']:>8}: unavailable: {result['error']}")
+            # Missing backends only fail the run when they were asked for
+            if args.decoders:
+                failed += 1
+        elif "error" in result:
+            print(f"{result['decoder']:>8}: failed: {result['error']}")
+            failed += 1
+        else:
+            print(f"{result['decoder']:>8}: {result['frames']} frames in {result['seconds']:.2f} s "
+                  f"({result['fps']:.1f} fps)")
+    return EXIT_RENDER_FAILED if failed else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        pipeline = load_pipeline(args.mappings)
+    except (OSError, ValueError) as e:
+        print(f"error: could not load mappings: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    inputs = expand_inputs(args.inputs)
+    missing = [p for p in inputs if not os.path.isfile(p)]
+    if missing:
+        print(f"error: no such file: {missing[0]}", file=sys.stderr)
+        return EXIT_USAGE
+    if not inputs:
+        print("error: no input videos found", file=sys.stderr)
+        return EXIT_USAGE
+
+    encoder = encoder_settings(args)
+    try:
+        extension = output_extension(encoder)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    many = len(inputs) > 1
+    if many:
+        os.makedirs(args.out, exist_ok=True)
+    jobs = [(src, output_path(src, args.out, many, extension)) for src in inputs]
+    if extension != ".mp4" and any(os.path.splitext(dst)[1].lower() != extension for _, dst in jobs):
+        print(f"error: {encoder.codec} output needs a {extension} file name", file=sys.stderr)
+        return EXIT_USAGE
+    outputs = [os.path.abspath(dst) for _, dst in jobs]
+    if len(set(outputs)) != len(outputs):
+        print("error: several inputs would be written to the same output file", file=sys.stderr)
+        return EXIT_USAGE
+    workers = max(1, args.workers)
+    options = dict(decoder=args.decoder, decode_threads=args.decode_threads,
+                   encoder=encoder, passthrough=args.passthrough,
+                   skip_untouched=args.skip_untouched, engine=args.engine)
+
+    failed = 0
+    if not many:
+        # A single clip is split into chunks across all workers
+        src, dst = jobs[0]
+        try:
+            summary = render_one(src, dst, pipeline, workers, None, options, args.timings)
+            print(f"{src} -> {dst}: {summary}")
+        except Exception as e:
+            print(f"{src}: failed: {e}", file=sys.stderr)
+            failed += 1
+    else:
+        # Several clips render side by side, one process each
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(src, dst, pool.submit(render_one, src, dst, pipeline, 1, threads, options,
+                                                         args.timings))
+                       for src, dst in jobs]
+            for src, dst, future in futures:
+                try:
+                    print(f"{src} -> {dst}: {future.result()}")
+                except Exception as e:
+                    print(f"{src}: failed: {e}", file=sys.stderr)
+                    failed += 1
+
+    return EXIT_RENDER_FAILED if failed else EXIT_OK
@@ -0,0 +1,439 @@
+"""
+Reproducible throughput benchmark of the preview and export paths.
+
+    python main.py bench --json results.json
+    python main.py bench --sizes 1080p --baseline results.json
+
+Generates synthetic clips (color bars, gradients and noise, whose colors
+are known), then times every stage on them: decode, the transform with 0
+to MAX_MAPPINGS mappings, the display conversion, encode, and a whole
+export_video run. Results can be written as JSON and compared against a
+previously saved file, so throughput regressions show up before release.
+
+Like batch.py this never needs a display; the display stage only includes
+the QImage wrap and paint when PyQt5 is installed.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from batch import EXIT_OK, EXIT_USAGE
+from color_engine import DEFAULT_ENGINE, ENGINES, MAX_MAPPINGS, ColorTransformPipeline
+from export import export_video
+from video_io import (DECODERS, DEFAULT_DECODER, DEFAULT_ENCODER_PRESET, ENCODER_PRESETS, open_source,
+                      open_writer, resolve_encoder)
+
+# Version of the JSON results layout
+RESULTS_VERSION = 1
+
+# Exit code when a stage got slower than the baseline allows
+EXIT_REGRESSED = 1
+
+SIZES = {
+    "480p": (854, 480),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+PATTERNS = ("bars", "gradient", "noise")
+STAGES = ("decode", "transform", "display", "encode", "export")
+
+# Color bars in BGR: white, yellow, cyan, green, magenta, red, blue, black
+BAR_COLORS = np.array([
+    (255, 255, 255), (0, 255, 255), (255, 255, 0), (0, 255, 0),
+    (255, 0, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0),
+], dtype=np.uint8)
+
+CLIP_FRAMES = 60
+CLIP_FPS = 30
+
+# Clips are encoded with this preset, so decoding them is representative
+CLIP_ENCODER_PRESET = "balanced"
+
+# Decoded frames kept for the transform, display and encode stages
+SAMPLE_FRAMES = 10
+
+# Size of the preview area the display stage scales frames down into
+DISPLAY_SIZE = (1280, 720)
+
+# Slowdown beyond which a stage counts as regressed
+REGRESSION_TOLERANCE = 0.10
+
+
+def make_frame(pattern, size, index):
+    """
+    Returns frame index of a synthetic clip as a BGR array. Every pattern
+    moves from frame to frame so the encoder has work to do, and is fully
+    determined by pattern, size and index.
+    """
+    w, h = size
+    if pattern == "bars":
+        # Eight bars scrolling left by 8 pixels per frame
+        columns = ((np.arange(w) + 8 * index) * len(BAR_COLORS) // w) % len(BAR_COLORS)
+        return np.ascontiguousarray(np.broadcast_to(BAR_COLORS[columns], (h, w, 3)))
+    if pattern == "gradient":
+        # Blue ramps across, green down, red steps with time
+        frame = np.empty((h, w, 3), dtype=np.uint8)
+        frame[..., 0] = (np.arange(w) * 256 // w).astype(np.uint8)
+        frame[..., 1] = (np.arange(h) * 256 // h).astype(np.uint8)[:, None]
+        frame[..., 2] = (4 * index) % 256
+        return frame
+    if pattern == "noise":
+        return np.random.default_rng(index).integers(0, 256, (h, w, 3), dtype=np.uint8)
+    raise ValueError(f"Unknown pattern: {pattern}")
+
+
+def synthetic_mappings(count):
+    """
+    Returns count mappings around the bar colors, each recoloring its bar
+    to the next one. Later mappings use wider ranges, so they overlap and
+    also catch parts of the gradient and noise clips.
+    """
+    mappings = []
+    for i in range(count):
+        color = BAR_COLORS[i % len(BAR_COLORS)].astype(int)
+        tolerance = 24 + 16 * (i // len(BAR_COLORS))
+        lower = np.clip(color - tolerance, 0, 255)
+        upper = np.clip(color + tolerance, 0, 255)
+        mappings.append((lower, upper, BAR_COLORS[(i + 1) % len(BAR_COLORS)]))
+    return mappings
+
+
+def generate_clip(path, pattern, size, frames=CLIP_FRAMES, fps=CLIP_FPS):
+    """Encodes a synthetic clip to path. Raises IOError if it cannot be written."""
+    writer = open_writer(path, fps, size, ENCODER_PRESETS[CLIP_ENCODER_PRESET])
+    try:
+        for index in range(frames):
+            writer.write(make_frame(pattern, size, index))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.release()
+
+
+def clip_path(directory, pattern, size_name, frames):
+    return os.path.join(directory, f"{pattern}_{size_name}_{frames}.mp4")
+
+
+def ensure_clip(directory, pattern, size_name, frames):
+    # Clips are deterministic, so one left by an earlier run is reused
+    path = clip_path(directory, pattern, size_name, frames)
+    if not os.path.isfile(path):
+        generate_clip(path + ".part.mp4", pattern, SIZES[size_name], frames)
+        os.replace(path + ".part.mp4", path)
+    return path
+
+
+def best_time(run, repeat):
+    # Best of repeat runs, so a single interruption does not skew the result
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        began = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - began)
+    return best
+
+
+def stage_result(clip, stage, frames, seconds, **extra):
+    result = {"clip": clip, "stage": stage, "frames": frames, "seconds": seconds,
+              "fps": frames / seconds if seconds > 0 else 0.0,
+              "ms_per_frame": 1000 * seconds / frames if frames else 0.0}
+    result.update(extra)
+    return result
+
+
+def decode_clip(path, decoder, threads, keep):
+    """Decodes path to the end and returns (frame count, the first keep frames)."""
+    source = open_source(path, decoder, threads)
+    try:
+        count = 0
+        kept = []
+        while True:
+            frame = source.read()
+            if frame is None:
+                break
+            if count < keep:
+                kept.append(frame)
+            count += 1
+    finally:
+        source.release()
+    return count, kept
+
+
+def make_display_conversion():
+    """
+    Returns a function doing what the player does to show a transformed
+    frame: scale it into DISPLAY_SIZE and, with PyQt5 installed, wrap it in
+    a QImage and paint it onto a canvas. Without PyQt5, or with a Qt too
+    old to take BGR, the frame is converted to RGB instead.
+    """
+    try:
+        from PyQt5.QtGui import QImage, QPainter
+    except ImportError:
+        QImage = None
+    canvas = QImage(*DISPLAY_SIZE, QImage.Format_RGB32) if QImage is not None else None
+    bgr_format = getattr(QImage, "Format_BGR888", None)
+
+    def convert(frame):
+        h, w = frame.shape[:2]
+        scale = min(DISPLAY_SIZE[0] / w, DISPLAY_SIZE[1] / h)
+        if scale < 1:
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_LINEAR)
+        if bgr_format is None:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if canvas is None:
+            return
+        h, w = frame.shape[:2]
+        image = QImage(frame.data, w, h, frame.strides[0],
+                       bgr_format if bgr_format is not None else QImage.Format_RGB888)
+        painter = QPainter(canvas)
+        painter.drawImage(0, 0, image)
+        painter.end()
+
+    convert.qt = canvas is not None
+    return convert
+
+
+def benchmark_clip(path, clip, options, work_dir, stages=STAGES, counts=None, log=None):
+    """
+    Runs the benchmark stages on one clip and returns their result dicts.
+
+    options holds decoder, decode_threads, engine, tiles, encoder, sample
+    and repeat (see build_parser). The transform runs once per mapping
+    count in counts (by default 0 to MAX_MAPPINGS).
+    """
+    if counts is None:
+        counts = range(MAX_MAPPINGS + 1)
+    repeat = options["repeat"]
+    results = []
+
+    def add(result):
+        results.append(result)
+        if log is not None:
+            log(result)
+
+    # The first decode pass keeps the frames the later stages work on
+    frame_count, sample = decode_clip(path, options["decoder"], options["decode_threads"], options["sample"])
+    if not sample:
+        raise IOError(f"Could not decode any frame of {path}")
+    if "decode" in stages:
+        seconds = best_time(lambda: decode_clip(path, options["decoder"], options["decode_threads"], 0), repeat)
+        add(stage_result(clip, "decode", frame_count, seconds, decoder=options["decoder"]))
+
+    transformed = sample
+    if "transform" in stages:
+        out = np.empty_like(sample[0])
+        for count in counts:
+            pipeline = ColorTransformPipeline(synthetic_mappings(count), engine=options["engine"],
+                                              tiles=options["tiles"])
+
+            def run():
+                for frame in sample:
+                    pipeline.process(frame, out=out)
+
+            add(stage_result(clip, "transform", len(sample), best_time(run, repeat),
+                             mappings=count, engine=options["engine"]))
+        pipeline = ColorTransformPipeline(synthetic_mappings(MAX_MAPPINGS), engine=options["engine"])
+        transformed = [pipeline.process(frame) for frame in sample]
+
+    if "display" in stages:
+        convert = make_display_conversion()
+
+        def run():
+            for frame in transformed:
+                convert(frame)
+
+        add(stage_result(clip, "display", len(transformed), best_time(run, repeat), qt=convert.qt))
+
+    h, w = sample[0].shape[:2]
+    encoded_path = os.path.join(work_dir, "encoded.mp4")
+    if "encode" in stages:
+        # The sample is written over and over up to the clip's length
+        def run():
+            writer = open_writer(encoded_path, CLIP_FPS, (w, h), options["encoder"])
+            try:
+                for index in range(frame_count):
+                    writer.write(transformed[index % len(transformed)])
+            except BaseException:
+                writer.abort()
+                raise
+            writer.release()
+
+        add(stage_result(clip, "encode", frame_count, best_time(run, repeat),
+                         encoder=options["encoder"].encoder, codec=options["encoder"].codec))
+
+    if "export" in stages:
+        # One full decode -> transform -> encode render, as Apply & Save runs it
+        began = time.perf_counter()
+        stats = export_video(path, encoded_path, synthetic_mappings(MAX_MAPPINGS), engine=options["engine"],
+                             decoder=options["decoder"], decode_threads=options["decode_threads"],
+                             encoder=options["encoder"], passthrough=False)
+        add(stage_result(clip, "export", stats.frames, time.perf_counter() - began,
+                         mappings=MAX_MAPPINGS, engine=options["engine"]))
+
+    if os.path.exists(encoded_path):
+        os.remove(encoded_path)
+    return results
+
+
+def result_key(result):
+    return result["clip"], result["stage"], result.get("mappings")
+
+
+def compare_results(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Matches results against the results of a baseline run by clip, stage
+    and mapping count. Returns (key, baseline fps, fps, regressed) tuples
+    for every result the baseline also has; regressed is set when the fps
+    fell by more than tolerance.
+    """
+    previous = {result_key(r): r["fps"] for r in baseline}
+    comparison = []
+    for result in results:
+        key = result_key(result)
+        if key not in previous:
+            continue
+        base_fps = previous[key]
+        regressed = base_fps > 0 and result["fps"] < base_fps * (1 - tolerance)
+        comparison.append((key, base_fps, result["fps"], regressed))
+    return comparison
+
+
+def environment():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py bench",
+                                     description="Benchmark decode, transform, display and encode "
+                                                 "on synthetic clips.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES),
+                        help="clip sizes (default: all)")
+    parser.add_argument("--patterns", nargs="+", choices=PATTERNS, default=list(PATTERNS),
+                        help="clip patterns (default: all)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="stages to time (default: all)")
+    parser.add_argument("--mapping-counts", nargs="+", type=int, default=None,
+                        help=f"mapping counts to transform with (default: 0 to {MAX_MAPPINGS})")
+    parser.add_argument("--frames", type=int, default=CLIP_FRAMES,
+                        help=f"frames per clip (default: {CLIP_FRAMES})")
+    parser.add_argument("--sample", type=int, default=SAMPLE_FRAMES,
+                        help=f"frames the transform, display and encode stages use (default: {SAMPLE_FRAMES})")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per stage; the fastest counts (default: 3)")
+    parser.add_argument("--clips", help="directory to keep generated clips in and reuse them from "
+                                        "(default: a temporary directory)")
+    parser.add_argument("--decoder", choices=sorted(DECODERS), default=DEFAULT_DECODER,
+                        help=f"decode backend (default: {DEFAULT_DECODER})")
+    parser.add_argument("--decode-threads", type=int, default=None,
+                        help="decoder threads (default: chosen by the backend)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                        help=f"transform engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument("--tiles", type=int, default=1,
+                        help="strips each frame is transformed in; 0 picks them like the player does "
+                             "(default: 1)")
+    parser.add_argument("--encoder-preset", choices=sorted(ENCODER_PRESETS), default=DEFAULT_ENCODER_PRESET,
+                        help=f"encoder settings of the encode and export stages "
+                             f"(default: {DEFAULT_ENCODER_PRESET})")
+    parser.add_argument("--json", dest="json_path", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help=f"slowdown that counts as a regression (default: {REGRESSION_TOLERANCE:.2f})")
+    return parser
+
+
+def print_result(result):
+    detail = ""
+    if result.get("mappings") is not None:
+        detail = f" ({result['mappings']} mappings)"
+    print(f"{result['clip']:>14} {result['stage']:>9}{detail:<15}: {result['fps']:8.1f} fps "
+          f"{result['ms_per_frame']:8.2f} ms/frame")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    counts = args.mapping_counts
+    if counts is not None and any(not 0 <= c <= MAX_MAPPINGS for c in counts):
+        print(f"error: mapping counts must be between 0 and {MAX_MAPPINGS}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.frames < 1 or args.sample < 1:
+        print("error: --frames and --sample must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"error: could not load baseline: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        if baseline.get("version") != RESULTS_VERSION:
+            print(f"error: unsupported baseline version: {baseline.get('version')}", file=sys.stderr)
+            return EXIT_USAGE
+
+    try:
+        encoder = resolve_encoder(ENCODER_PRESETS[args.encoder_preset])
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    options = dict(decoder=args.decoder, decode_threads=args.decode_threads, engine=args.engine,
+                   tiles=args.tiles if args.tiles > 0 else None, encoder=encoder,
+                   sample=args.sample, repeat=args.repeat)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        clips_dir = args.clips or work_dir
+        os.makedirs(clips_dir, exist_ok=True)
+        for size_name in args.sizes:
+            for pattern in args.patterns:
+                clip = f"{pattern}_{size_name}"
+                try:
+                    path = ensure_clip(clips_dir, pattern, size_name, args.frames)
+                    results.extend(benchmark_clip(path, clip, options, work_dir, args.stages, counts,
+                                                  log=print_result))
+                except (IOError, ImportError, ValueError) as e:
+                    print(f"error: {clip}: {e}", file=sys.stderr)
+                    return EXIT_USAGE
+
+    report = {
+        "version": RESULTS_VERSION,
+        "environment": environment(),
+        "settings": {"frames": args.frames, "sample": args.sample, "repeat": args.repeat,
+                     "decoder": args.decoder, "engine": args.engine, "tiles": args.tiles,
+                     "encoder": encoder._asdict()},
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is None:
+        return EXIT_OK
+    comparison = compare_results(results, baseline["results"], args.tolerance)
+    regressed = 0
+    print(f"\nCompared with {args.baseline}:")
+    if baseline.get("settings") != report["settings"] or baseline.get("environment") != report["environment"]:
+        print("note: the baseline was run with other settings or on another machine")
+    for (clip, stage, mappings), base_fps, fps, slower in comparison:
+        regressed += slower
+        label = f"{stage} ({mappings} mappings)" if mappings is not None else stage
+        change = f" ({fps / base_fps - 1:+.0%})" if base_fps > 0 else ""
+        print(f"{clip:>14} {label:<24}: {base_fps:8.1f} -> {fps:8.1f} fps{change}"
+              f"{'  REGRESSED' if slower else ''}")
+    if not comparison:
+        print("no results in common with the baseline")
+    return EXIT_REGRESSED if regressed else EXIT_OK
@@ -0,0 +1,575 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Number of entries in a full BGR lookup table (one per 24-bit color)
+LUT_SIZE = 1 << 24
+
+# Alpha byte stored in every packed entry so the table can be viewed as BGRA
+_ALPHA = 0xFF000000
+
+_identity_lut = None
+
+# Mappings the player lets the user define
+MAX_MAPPINGS = 10
+
+# Mappings a per-channel bitmask can hold (one bit each in a uint16)
+MAX_BITMASK_MAPPINGS = 16
+
+_highest_bit_table = None
+
+# jit_kernel.fused_transform once imported, or False when numba is missing
+_jit_kernel = None
+
+# Numba's workqueue threading layer (see jit_kernel) must not run two
+# parallel kernels at once
+_jit_lock = threading.Lock()
+
+# Smallest strip worth handing to another thread (about a 512x512 block);
+# below this the handoff costs more than the transform saves
+MIN_TILE_PIXELS = 1 << 18
+
+_tile_pool = None
+_tile_pool_lock = threading.Lock()
+
+
+def _get_identity_lut():
+    """
+    Returns the packed identity table, building it on first use.
+
+    Entry i holds the color whose index is i, i.e. B | G << 8 | R << 16,
+    with the alpha byte set. Building it costs ~64 MB once per process.
+    """
+    global _identity_lut
+    if _identity_lut is None:
+        _identity_lut = np.arange(LUT_SIZE, dtype=np.uint32)
+        _identity_lut |= np.uint32(_ALPHA)
+    return _identity_lut
+
+
+def _get_highest_bit_table():
+    """
+    Returns the 65536-entry uint8 table giving 1 + the index of the highest
+    set bit of a uint16 (0 for 0), building it on first use.
+    """
+    global _highest_bit_table
+    if _highest_bit_table is None:
+        table = np.zeros(1 << MAX_BITMASK_MAPPINGS, dtype=np.uint8)
+        for bit in range(MAX_BITMASK_MAPPINGS):
+            table[1 << bit:2 << bit] = bit + 1
+        _highest_bit_table = table
+    return _highest_bit_table
+
+
+def _get_jit_kernel():
+    """Returns the compiled fused kernel, or None when numba is not installed."""
+    global _jit_kernel
+    if _jit_kernel is None:
+        # Importing numba starts threads and takes locks, so it must not
+        # overlap a fork any more than a launch may
+        with _jit_lock:
+            if _jit_kernel is None:
+                try:
+                    from jit_kernel import fused_transform
+                    _jit_kernel = fused_transform
+                except ImportError:
+                    _jit_kernel = False
+    return _jit_kernel or None
+
+
+def _get_tile_pool():
+    """Returns the process-wide thread pool strips run on, starting it on first use."""
+    global _tile_pool
+    with _tile_pool_lock:
+        if _tile_pool is None:
+            _tile_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="tile")
+        return _tile_pool
+
+
+def _before_fork():
+    # Forking while another thread (the prefetch thread, say) runs a jit
+    # kernel would copy Numba's thread pool mid-launch into the child, where
+    # it never finishes, so wait for the kernel
+    _jit_lock.acquire()
+
+
+def _after_fork_in_parent():
+    _jit_lock.release()
+
+
+def _after_fork_in_child():
+    # A forked child (an export worker) inherits the pool object but not its
+    # threads, and the locks as the parent's threads left them
+    global _tile_pool, _tile_pool_lock, _jit_lock
+    _tile_pool = None
+    _tile_pool_lock = threading.Lock()
+    _jit_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent,
+                        after_in_child=_after_fork_in_child)
+
+
+def choose_tiles(shape, cpus=None):
+    """
+    Returns how many horizontal strips to split a frame of the given shape
+    into: one per core, but no strip smaller than MIN_TILE_PIXELS, so small
+    preview frames stay on the calling thread.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    h, w = shape[:2]
+    return max(1, min(cpus, h * w // MIN_TILE_PIXELS, h))
+
+
+def apply_tiled(kernel, frame, tiles, out=None):
+    """
+    Runs kernel.apply on tiles horizontal strips of frame at once, on the
+    shared tile pool, and returns out.
+
+    Strips are views, so every engine writes its rows of out directly.
+    OpenCV and the NumPy calls the engines make release the GIL, so the
+    strips really do run in parallel. out may be frame itself.
+    """
+    if out is None:
+        out = np.empty_like(frame)
+    bounds = np.linspace(0, frame.shape[0], tiles + 1).astype(int)
+    strips = []
+    for top, bottom in zip(bounds[:-1], bounds[1:]):
+        src = frame[top:bottom]
+        # Engines recognise an in-place call by identity, so keep it per strip
+        strips.append((src, src if out is frame else out[top:bottom]))
+    pool = _get_tile_pool()
+    futures = [pool.submit(kernel.apply, src, out=dst) for src, dst in strips[1:]]
+    # The calling thread takes the first strip itself instead of waiting idle
+    kernel.apply(strips[0][0], out=strips[0][1])
+    for future in futures:
+        future.result()
+    return out
+
+
+def pack_color(color):
+    """Packs a B/G/R triple into the uint32 layout used by the lookup table."""
+    b, g, r = (int(c) for c in color)
+    return b | (g << 8) | (r << 16) | _ALPHA
+
+
+def compile_lut(mappings):
+    """
+    Folds a list of (lower, upper, new_color) mappings into a single
+    BGR -> BGR lookup table.
+
+    Every mapping is an inclusive box in BGR space (the same test as
+    cv2.inRange), so it can be written into the table with one slice
+    assignment. Mappings are applied in order, which keeps the existing
+    behaviour of later mappings winning where boxes overlap, while each box
+    is still tested against the original pixel color.
+
+    Returns None when there are no mappings, meaning "leave frames as is".
+    """
+    if not mappings:
+        return None
+
+    lut = _get_identity_lut().copy()
+    # Index is B | G << 8 | R << 16, so the cube is laid out as [R][G][B]
+    cube = lut.reshape(256, 256, 256)
+    for lower, upper, new_color in mappings:
+        cube[lower[2]:upper[2] + 1,
+             lower[1]:upper[1] + 1,
+             lower[0]:upper[0] + 1] = pack_color(new_color)
+    return lut
+
+
+def map_lut(path, offset=0):
+    """Memory-maps a packed lookup table stored at offset in a file."""
+    return np.memmap(path, dtype='<u4', mode='r', offset=offset, shape=(LUT_SIZE,))
+
+
+def apply_lut(frame, lut, out=None):
+    """
+    Transforms a BGR frame through a table built by compile_lut in a single
+    gather pass, regardless of how many mappings the table holds.
+
+    If out is given it must be a contiguous uint8 array of the same shape as
+    frame; it may be frame itself for an in-place transform.
+    """
+    h, w = frame.shape[:2]
+
+    # Pad to BGRA and view each pixel as one little-endian uint32 index
+    bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+    index = bgra.view('<u4').reshape(h, w)
+    np.bitwise_and(index, 0x00FFFFFF, out=index)
+
+    # Gather in place, then drop the alpha byte again
+    np.take(lut, index, out=index, mode='clip')
+    return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+
+
+def normalize_mappings(mappings):
+    """Converts (lower, upper, new_color) mappings into hashable int tuples."""
+    return tuple(
+        (tuple(int(v) for v in lower),
+         tuple(int(v) for v in upper),
+         tuple(int(v) for v in new_color))
+        for lower, upper, new_color in mappings
+    )
+
+
+def frame_touched(frame, mappings):
+    """
+    Returns True if any pixel of frame falls in one of the mappings' ranges.
+
+    A frame this returns False for comes out of the transform unchanged. The
+    test is conservative: a pixel mapped onto its own color still counts.
+    It needs no lookup table, so it is cheap to run on every frame.
+    """
+    for lower, upper, _ in mappings:
+        if cv2.countNonZero(cv2.inRange(frame, lower, upper)):
+            return True
+    return False
+
+
+def apply_loop(frame, mappings, out=None):
+    """
+    The original per-mapping transform: one cv2.inRange mask and one boolean
+    scatter per mapping, each tested against the original frame. Kept as
+    the reference the other engines are checked and benchmarked against.
+    """
+    if out is None:
+        original, out = frame, frame.copy()
+    elif out is frame:
+        original = frame.copy()
+    else:
+        original = frame
+        np.copyto(out, frame)
+    for lower, upper, new_color in mappings:
+        mask = cv2.inRange(original, lower, upper)
+        out[mask != 0] = new_color
+    return out
+
+
+def label_image(frame, mappings, out=None):
+    """
+    Returns a uint8 image holding, per pixel, 1 + the index of the last
+    mapping whose range contains it, or 0 where none does.
+
+    Each mapping's mask is clipped to its label and folded in with a max,
+    so later mappings win without any boolean indexing.
+    """
+    h, w = frame.shape[:2]
+    if out is None:
+        out = np.zeros((h, w), dtype=np.uint8)
+    else:
+        out.fill(0)
+    mask = np.empty((h, w), dtype=np.uint8)
+    for label, (lower, upper, _) in enumerate(mappings, start=1):
+        cv2.inRange(frame, lower, upper, dst=mask)
+        cv2.min(mask, label, dst=mask)
+        cv2.max(out, mask, dst=out)
+    return out
+
+
+def compile_bitmasks(mappings):
+    """
+    Returns per-channel membership tables as a (1, 256, 3) uint16 array, in
+    the layout cv2.LUT takes: bit i of entry [0, v, c] is set when mapping
+    i accepts value v in channel c.
+
+    Mappings are boxes in BGR space, so a pixel lies in mapping i exactly
+    when bit i is set in all three of its channel entries.
+    """
+    if len(mappings) > MAX_BITMASK_MAPPINGS:
+        raise ValueError(f"The bitmask engine supports at most {MAX_BITMASK_MAPPINGS} mappings")
+    tables = np.zeros((1, 256, 3), dtype=np.uint16)
+    for i, (lower, upper, _) in enumerate(mappings):
+        for c in range(3):
+            tables[0, lower[c]:upper[c] + 1, c] |= np.uint16(1 << i)
+    return tables
+
+
+def apply_palette(frame, labels, palette, out=None):
+    """
+    Copies palette[label] over every pixel with a non-zero label and keeps
+    the others. palette row 0 is never used.
+    """
+    colors = np.take(palette, labels, axis=0)
+    if out is None:
+        out = frame.copy()
+    elif out is not frame:
+        np.copyto(out, frame)
+    cv2.copyTo(colors, labels, out)
+    return out
+
+
+def make_palette(mappings):
+    # Row 0 is never copied; it only keeps labels and rows aligned
+    return np.array([(0, 0, 0)] + [new_color for _, _, new_color in mappings], dtype=np.uint8)
+
+
+class LutEngine:
+    """
+    Full 24-bit lookup table (see compile_lut): 64 MB to build, then a
+    single gather per frame however many mappings there are.
+    """
+    name = "lut"
+    tileable = True
+
+    def __init__(self, mappings, lut=None):
+        self.lut = lut if lut is not None else compile_lut(mappings)
+
+    def apply(self, frame, out=None):
+        return apply_lut(frame, self.lut, out=out)
+
+
+class LabelEngine:
+    """
+    Label image plus palette: label_image finds the winning mapping of
+    every pixel, np.take turns labels into colors and the labelled pixels
+    are copied over the frame. Compiles instantly, so it suits interactive
+    edits.
+    """
+    name = "label"
+    tileable = True
+
+    def __init__(self, mappings, lut=None):
+        if len(mappings) > 255:
+            raise ValueError("The label engine supports at most 255 mappings")
+        self.mappings = mappings
+        self.palette = make_palette(mappings)
+
+    def apply(self, frame, out=None):
+        labels = label_image(frame, self.mappings)
+        return apply_palette(frame, labels, self.palette, out=out)
+
+
+class BitmaskEngine:
+    """
+    Separable classifier: one cv2.LUT pass looks up the membership bitmask
+    of every channel value (see compile_bitmasks), two ANDs leave the
+    mappings containing each pixel, and a highest-set-bit table picks the
+    last of them as the label for the palette.
+
+    No per-mapping passes, and its tables take 1.5 KB (plus the shared
+    64 KB bit table), so they stay in cache and rebuild in microseconds.
+    """
+    name = "bitmask"
+    tileable = True
+
+    def __init__(self, mappings, lut=None):
+        self.tables = compile_bitmasks(mappings)
+        self.palette = make_palette(mappings)
+
+    def apply(self, frame, out=None):
+        bits = cv2.LUT(frame, self.tables)
+        members = cv2.bitwise_and(bits[..., 0], bits[..., 1])
+        cv2.bitwise_and(members, bits[..., 2], dst=members)
+        labels = np.take(_get_highest_bit_table(), members)
+        return apply_palette(frame, labels, self.palette, out=out)
+
+
+class JitEngine(BitmaskEngine):
+    """
+    The bitmask classifier fused into a single Numba kernel (see jit_kernel)
+    that runs over rows in parallel, so each frame is read and written once
+    instead of once per NumPy/OpenCV step. Without numba installed it runs
+    the NumPy bitmask path instead.
+    """
+    name = "jit"
+
+    @property
+    def tileable(self):
+        # The kernel already spreads rows over every core
+        return _get_jit_kernel() is None
+
+    def apply(self, frame, out=None):
+        kernel = _get_jit_kernel()
+        if kernel is None:
+            return super().apply(frame, out=out)
+        if out is None:
+            out = np.empty_like(frame)
+        with _jit_lock:
+            kernel(frame, out, self.tables, _get_highest_bit_table(), self.palette, out is not frame)
+        return out
+
+
+class LoopEngine:
+    """The original per-mapping loop (see apply_loop)."""
+    name = "loop"
+    tileable = True
+
+    def __init__(self, mappings, lut=None):
+        self.mappings = mappings
+
+    def apply(self, frame, out=None):
+        return apply_loop(frame, self.mappings, out=out)
+
+
+# Transform engines by name. Every engine is built from normalized mappings
+# (lut is a precompiled table, which only the LUT engine uses) and applies
+# them with apply(frame, out=None), following ColorTransformPipeline.process.
+# tileable says whether apply may run on strips of a frame concurrently.
+ENGINES = {
+    LutEngine.name: LutEngine,
+    LabelEngine.name: LabelEngine,
+    BitmaskEngine.name: BitmaskEngine,
+    JitEngine.name: JitEngine,
+    LoopEngine.name: LoopEngine,
+}
+DEFAULT_ENGINE = LutEngine.name
+
+
+def as_pipeline(mappings, engine=None):
+    """
+    Returns mappings unchanged if it already is a pipeline, else compiles
+    one. With engine set, the result uses that engine.
+    """
+    if isinstance(mappings, ColorTransformPipeline):
+        if engine is None or engine == mappings.engine:
+            return mappings
+        return ColorTransformPipeline(mappings.mappings, mappings.lut, engine, mappings.tiles)
+    return ColorTransformPipeline(mappings, engine=engine or DEFAULT_ENGINE)
+
+
+class ColorTransformPipeline:
+    """
+    GUI-free frame transform shared by the preview and the export paths.
+
+    Holds a snapshot of the color mappings together with the engine compiled
+    from them (one of ENGINES). Call set_mappings whenever the mappings may
+    have changed; the engine is only rebuilt when the snapshot differs.
+
+    tiles splits each frame into that many horizontal strips transformed in
+    parallel (see apply_tiled), or a number chosen per frame by choose_tiles
+    when None. The default of 1 suits callers that already transform
+    several frames at once, like the export pipeline.
+    """
+    def __init__(self, mappings=(), lut=None, engine=DEFAULT_ENGINE, tiles=1):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown transform engine: {engine}")
+        self.engine = engine
+        self.tiles = tiles
+        self.mappings = ()
+        self.kernel = None
+        self.set_mappings(mappings, lut)
+
+    def set_mappings(self, mappings, lut=None):
+        """
+        Updates the mapping snapshot. Returns True if it changed.
+
+        lut may be a table previously compiled from the same mappings (for
+        example memory-mapped from a preset file) to skip recompilation.
+        """
+        mappings = normalize_mappings(mappings)
+        if mappings == self.mappings and lut is None:
+            return False
+        self.kernel = ENGINES[self.engine](mappings, lut) if mappings else None
+        self.mappings = mappings
+        return True
+
+    def set_engine(self, engine):
+        """Switches to another of ENGINES, recompiling the current mappings."""
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown transform engine: {engine}")
+        if engine != self.engine:
+            self.engine = engine
+            self.kernel = ENGINES[engine](self.mappings) if self.mappings else None
+
+    @property
+    def lut(self):
+        """The compiled lookup table with the LUT engine, else None."""
+        kernel = self.kernel
+        return kernel.lut if isinstance(kernel, LutEngine) else None
+
+    def __getstate__(self):
+        # Pipelines are pickled into export worker processes. A table mapped
+        # from a file travels as its location; any other is recompiled on
+        # arrival rather than copying 64 MB through a pipe. Workers transform
+        # whole frames in parallel, so tiles is not carried over.
+        lut = self.lut
+        lut_file = None
+        if isinstance(lut, np.memmap) and lut.filename:
+            lut_file = (lut.filename, lut.offset)
+        return {"mappings": self.mappings, "lut_file": lut_file, "engine": self.engine}
+
+    def __setstate__(self, state):
+        lut = None
+        if state["lut_file"] is not None:
+            filename, offset = state["lut_file"]
+            lut = map_lut(filename, offset)
+        self.engine = state.get("engine", DEFAULT_ENGINE)
+        self.tiles = 1
+        self.mappings = ()
+        self.kernel = None
+        self.set_mappings(state["mappings"], lut)
+
+    @property
+    def is_identity(self):
+        return self.kernel is None
+
+    def touches(self, frame):
+        return frame_touched(frame, self.mappings)
+
+    def process(self, frame, out=None):
+        """
+        Applies the mappings to a BGR frame and returns the result.
+
+        out may be a preallocated buffer of the same shape, or frame itself
+        for an in-place transform. Without out a new array is returned, except
+        when there are no mappings, in which case frame is returned untouched.
+        """
+        # Read the engine once; a playback thread may call this while the
+        # GUI thread swaps in a new one
+        kernel = self.kernel
+        if kernel is None:
+            if out is None or out is frame:
+                return frame
+            np.copyto(out, frame)
+            return out
+        tiles = self.tiles
+        if tiles is None:
+            tiles = choose_tiles(frame.shape)
+        # Every strip needs at least one row
+        tiles = min(tiles, frame.shape[0])
+        if tiles > 1 and kernel.tileable:
+            return apply_tiled(kernel, frame, tiles, out=out)
+        return kernel.apply(frame, out=out)
+
+
+def benchmark_engines(frames, mappings, engines=None, repeat=3, tiles=1):
+    """
+    Transforms the same frames with each engine and returns one result dict
+    per engine with compile_ms, frames, seconds, fps and whether its output
+    matches the original loop's, or error if the engine cannot take the
+    mappings. tiles is passed on to the pipeline (None picks it per frame).
+
+    The best of repeat runs is kept, so timings are not skewed by a single
+    interruption.
+    """
+    mappings = normalize_mappings(mappings)
+    reference = [apply_loop(frame, mappings) for frame in frames]
+    results = []
+    for engine in engines or ENGINES:
+        began = time.perf_counter()
+        try:
+            pipeline = ColorTransformPipeline(mappings, engine=engine, tiles=tiles)
+        except ValueError as e:
+            results.append({"engine": engine, "error": str(e)})
+            continue
+        compile_ms = (time.perf_counter() - began) * 1000
+        out = np.empty_like(frames[0])
+        matches = all(np.array_equal(pipeline.process(frame, out=out), expected)
+                      for frame, expected in zip(frames, reference))
+        best = float("inf")
+        for _ in range(repeat):
+            began = time.perf_counter()
+            for frame in frames:
+                pipeline.process(frame, out=out)
+            best = min(best, time.perf_counter() - began)
+        results.append({"engine": engine, "compile_ms": compile_ms, "frames": len(frames),
+                        "seconds": best, "fps": len(frames) / best if best > 0 else 0.0,
+                        "matches": matches})
+    return results
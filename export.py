@@ -0,0 +1,687 @@
+import multiprocessing
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from color_engine import ColorTransformPipeline, as_pipeline, frame_touched, normalize_mappings
+from profiling import RollingHistogram
+from video_io import (CODEC_PIX_FMTS, DEFAULT_DECODER, ENCODERS, demux_keyframes, find_ffmpeg, find_ffprobe,
+                      open_source, open_writer, passthrough_args, probe, resolve_encoder, video_format)
+
+# Chunks shorter than this are not worth a process of their own
+MIN_CHUNK_FRAMES = 250
+
+# Chunk boundaries move to a keyframe at most this share of a chunk away;
+# farther keyframes would unbalance the chunks more than they save
+KEYFRAME_SNAP = 0.25
+
+# Default number of frames each queue between pipeline stages may hold
+QUEUE_DEPTH = 8
+
+STAGES = ("decode", "transform", "encode")
+
+# Seconds between progress reports (and cancellation checks) of a render
+PROGRESS_INTERVAL = 0.25
+
+# Source codecs whose GOPs can be spliced with segments that the given
+# ffmpeg codec re-encoded (see render_spliced). H.264 only: ffmpeg's concat
+# demuxer rewrites just H.264 with in-band parameter sets.
+SPLICE_CODECS = {"h264": "libx264"}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def keyframe_indices(src_path):
+    """
+    Returns the indices of the keyframes of the first video stream, or an
+    empty list when neither ffprobe nor PyAV is available or the probe fails.
+    """
+    ffprobe = find_ffprobe()
+    if ffprobe is None:
+        return demux_keyframes(src_path)
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "packet=flags", "-of", "csv=p=0", src_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [i for i, flags in enumerate(result.stdout.split()) if "K" in flags]
+
+
+def plan_chunks(frame_count, workers, keyframes=()):
+    """
+    Splits [0, frame_count) into at most `workers` contiguous frame ranges.
+
+    Boundaries are snapped to the nearest keyframe when one lies within
+    KEYFRAME_SNAP of a chunk length, so each worker's initial seek does not
+    have to decode a partial GOP; otherwise the even split is kept, since
+    every chunk is re-encoded anyway. The last range is open-ended (stop is
+    None) because the frame count reported by containers is not always
+    exact.
+    """
+    workers = max(1, min(workers, frame_count // MIN_CHUNK_FRAMES))
+    bounds = [0]
+    max_shift = KEYFRAME_SNAP * frame_count / workers
+    for i in range(1, workers):
+        target = i * frame_count // workers
+        if keyframes:
+            nearest = min(keyframes, key=lambda k: abs(k - target))
+            if abs(nearest - target) <= max_shift:
+                target = nearest
+        if target > bounds[-1]:
+            bounds.append(target)
+    stops = bounds[1:] + [None]
+    return list(zip(bounds, stops))
+
+
+class PipelineStats:
+    """
+    Frame count and per-stage busy time of a render. copied counts the
+    frames among them that were stream-copied rather than re-encoded.
+    timings holds the per-frame time of each stage (see timing_summary).
+
+    Utilisation is the share of wall time a stage spent working, averaged
+    over the threads or processes running it. The stage closest to 100% is
+    the bottleneck; the others spend the rest of their time waiting on it.
+    """
+    def __init__(self):
+        self.frames = 0
+        self.copied = 0
+        self.wall_time = 0.0
+        self.busy = dict.fromkeys(STAGES, 0.0)
+        self.threads = dict.fromkeys(STAGES, 1)
+        # Unbounded, so the percentiles and max cover the whole render
+        self.timings = {stage: RollingHistogram(window=None) for stage in STAGES}
+
+    def merge(self, other):
+        # Combine stats of chunks that ran side by side
+        self.frames += other.frames
+        self.copied += other.copied
+        self.wall_time = max(self.wall_time, other.wall_time)
+        for stage in STAGES:
+            self.busy[stage] += other.busy[stage]
+            self.threads[stage] += other.threads[stage]
+            self.timings[stage].merge(other.timings[stage])
+
+    def utilisation(self):
+        if self.wall_time <= 0:
+            return dict.fromkeys(STAGES, 0.0)
+        return {stage: self.busy[stage] / (self.wall_time * self.threads[stage])
+                for stage in STAGES}
+
+    @property
+    def fps(self):
+        return self.frames / self.wall_time if self.wall_time > 0 else 0.0
+
+    def __str__(self):
+        usage = ", ".join(f"{stage} {u:.0%} ({self.threads[stage]}x)"
+                          for stage, u in self.utilisation().items())
+        copied = f" ({self.copied} stream-copied)" if self.copied else ""
+        return f"{self.frames} frames{copied} in {self.wall_time:.1f}s ({self.fps:.1f} fps); {usage}"
+
+    def timing_summary(self):
+        """Per-frame p50/p95/max of each stage that timed any frames, one line each."""
+        return "\n".join(f"{stage}: {timing}" for stage, timing in self.timings.items() if timing)
+
+
+class ProgressReporter:
+    """
+    Batches per-frame progress into reports every PROGRESS_INTERVAL seconds.
+
+    progress is called with the number of frames finished since the last
+    report. The cancel event is polled at the same rate, because in worker
+    processes it is a proxy and every check is a round trip to the manager.
+    """
+    def __init__(self, progress=None, cancel=None):
+        self.progress = progress
+        self.cancel = cancel
+        self.pending = 0
+        self.last_report = time.perf_counter()
+
+    def frame_done(self, count=1):
+        self.pending += count
+        if time.perf_counter() - self.last_report >= PROGRESS_INTERVAL:
+            self.report()
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        if self.pending and self.progress is not None:
+            self.progress(self.pending)
+        self.pending = 0
+        if self.cancel is not None and self.cancel.is_set():
+            raise ExportCancelled()
+
+
+def open_chunk(src_path, dst_path, start=0, decoder=DEFAULT_DECODER, decode_threads=None, encoder=None,
+               passthrough=None):
+    """Opens a VideoSource positioned at start and a matching VideoWriter."""
+    source = open_source(src_path, decoder, decode_threads)
+    try:
+        if start:
+            source.seek(start)
+        out = open_writer(dst_path, source.fps, source.size, encoder, passthrough)
+    except BaseException:
+        source.release()
+        raise
+    return source, out
+
+
+def render_chunk(src_path, dst_path, mappings, start=0, stop=None, transform_threads=0,
+                 queue_depth=QUEUE_DEPTH, decoder=DEFAULT_DECODER, decode_threads=None,
+                 encoder=None, passthrough=None, engine=None, progress=None, cancel=None):
+    """
+    Transforms frames [start, stop) of src_path into dst_path using its own
+    capture and writer, and returns the PipelineStats of the render.
+
+    With transform_threads > 0 decode, transform and encode run as a
+    threaded pipeline (see render_pipelined); otherwise frames are processed
+    one after the other. decoder and decode_threads select the decode
+    backend (see video_io.open_source), encoder and passthrough configure
+    the writer (see video_io.open_writer).
+
+    progress and cancel are passed on to a ProgressReporter; a set cancel
+    event stops the render with ExportCancelled.
+
+    This runs inside worker processes, so it only takes picklable arguments.
+    mappings may be a list of mappings or a ColorTransformPipeline; a plain
+    list is compiled here, in the worker. engine, if set, selects the
+    transform engine (see color_engine.ENGINES).
+    """
+    pipeline = as_pipeline(mappings, engine)
+    reporter = ProgressReporter(progress, cancel)
+    source, out = open_chunk(src_path, dst_path, start, decoder, decode_threads, encoder, passthrough)
+    try:
+        if transform_threads > 0:
+            stats = render_pipelined(source, out, pipeline, start, stop,
+                                     transform_threads, queue_depth, reporter)
+        else:
+            stats = render_serial(source, out, pipeline, start, stop, reporter)
+        reporter.report()
+    except BaseException:
+        out.abort()
+        raise
+    finally:
+        source.release()
+    # Finishing the file flushes the encoder, which is part of encoding
+    t0 = time.perf_counter()
+    out.release()
+    stats.busy["encode"] += time.perf_counter() - t0
+    return stats
+
+
+def render_serial(source, out, pipeline, start=0, stop=None, reporter=None):
+    if reporter is None:
+        reporter = ProgressReporter()
+    stats = PipelineStats()
+    clock = time.perf_counter
+    began = clock()
+    while stop is None or start + stats.frames < stop:
+        t0 = clock()
+        frame = source.read()
+        t1 = clock()
+        stats.busy["decode"] += t1 - t0
+        if frame is None:
+            break
+        stats.timings["decode"].add(t1 - t0)
+        frame = pipeline.process(frame, out=frame)
+        t2 = clock()
+        out.write(frame)
+        t3 = clock()
+        stats.busy["transform"] += t2 - t1
+        stats.busy["encode"] += t3 - t2
+        stats.timings["transform"].add(t2 - t1)
+        stats.timings["encode"].add(t3 - t2)
+        stats.frames += 1
+        reporter.frame_done()
+    stats.wall_time = clock() - began
+    return stats
+
+
+def render_pipelined(source, out, pipeline, start=0, stop=None,
+                     transform_threads=2, queue_depth=QUEUE_DEPTH, reporter=None):
+    """
+    Runs decode, transform and encode concurrently.
+
+    A reader thread feeds decoded frames to a pool of transform threads
+    (OpenCV and NumPy release the GIL while they work), and the calling
+    thread writes the results back in frame order. The queues between the
+    stages are bounded by queue_depth, which caps how many frames are held
+    in memory at once.
+    """
+    if reporter is None:
+        reporter = ProgressReporter()
+    stats = PipelineStats()
+    stats.threads["transform"] = transform_threads
+    clock = time.perf_counter
+    decoded = queue.Queue(maxsize=queue_depth)
+    transformed = queue.Queue(maxsize=queue_depth)
+    stop_event = threading.Event()
+    errors = []
+    lock = threading.Lock()
+
+    # Queue helpers that give up instead of blocking forever once another
+    # stage has failed
+    def put(q, item):
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def read_frames():
+        index = 0
+        busy = 0.0
+        try:
+            while stop is None or start + index < stop:
+                t0 = clock()
+                frame = source.read()
+                elapsed = clock() - t0
+                busy += elapsed
+                if frame is None or not put(decoded, (index, frame)):
+                    break
+                stats.timings["decode"].add(elapsed)
+                index += 1
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            stats.busy["decode"] = busy
+            for _ in range(transform_threads):
+                put(decoded, None)
+
+    def transform_frames():
+        busy = 0.0
+        try:
+            while True:
+                item = get(decoded)
+                if item is None:
+                    break
+                index, frame = item
+                t0 = clock()
+                frame = pipeline.process(frame, out=frame)
+                elapsed = clock() - t0
+                busy += elapsed
+                stats.timings["transform"].add(elapsed)
+                if not put(transformed, (index, frame)):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            with lock:
+                stats.busy["transform"] += busy
+            put(transformed, None)
+
+    began = clock()
+    threads = [threading.Thread(target=read_frames, daemon=True)]
+    threads += [threading.Thread(target=transform_frames, daemon=True)
+                for _ in range(transform_threads)]
+    for t in threads:
+        t.start()
+
+    # Write on this thread, holding back frames that arrive out of order
+    pending = {}
+    running = transform_threads
+    try:
+        while running and not stop_event.is_set():
+            item = get(transformed)
+            if item is None:
+                running -= 1
+                continue
+            index, frame = item
+            pending[index] = frame
+            while stats.frames in pending:
+                t0 = clock()
+                out.write(pending.pop(stats.frames))
+                elapsed = clock() - t0
+                stats.busy["encode"] += elapsed
+                stats.timings["encode"].add(elapsed)
+                stats.frames += 1
+                reporter.frame_done()
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    stats.wall_time = clock() - began
+    return stats
+
+
+def concat_segments(segment_paths, dst_path, passthrough=None):
+    """
+    Joins segments written with identical settings without re-encoding.
+    With passthrough, (src_path, args) from video_io.passthrough_args, the
+    selected tracks of src_path are copied into dst_path in the same pass.
+    """
+    list_fd, list_path = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(list_fd, "w") as f:
+            for path in segment_paths:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        cmd = [find_ffmpeg(), "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+        if passthrough is not None:
+            src_path, args = passthrough
+            cmd += ["-i", src_path, "-map", "0:v:0"] + list(args) + ["-c:v", "copy", dst_path]
+        else:
+            cmd += ["-map", "0:v:0", "-c", "copy", dst_path]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise IOError(f"Could not join segments: {e.stderr.decode(errors='replace').strip()}")
+    finally:
+        os.remove(list_path)
+
+
+def export_video(src_path, dst_path, mappings, workers=None, transform_threads=None,
+                 queue_depth=QUEUE_DEPTH, decoder=DEFAULT_DECODER, decode_threads=None,
+                 encoder=None, passthrough=True, skip_untouched=False, engine=None,
+                 progress=None, cancel=None):
+    """
+    Renders src_path with the given mappings into dst_path.
+
+    Long videos are split into keyframe-aligned chunks which are rendered in
+    parallel worker processes and then concatenated losslessly. Without an
+    ffmpeg binary for the concatenation, or when the clip is too short to
+    split, the video is rendered in a single pass instead.
+
+    Each chunk runs as a threaded decode -> transform -> encode pipeline with
+    transform_threads transform threads (by default the cores left over per
+    worker process), or serially when transform_threads is 0. decoder and
+    decode_threads select the decode backend of every chunk. encoder is an
+    EncoderSettings (by default video_io.DEFAULT_ENCODER_PRESET); without a
+    thread count each chunk's encoder gets its share of the cores. engine
+    overrides the transform engine (see color_engine.ENGINES).
+
+    With passthrough the audio, subtitle and metadata tracks of src_path
+    are stream-copied into dst_path: by the ffmpeg encoder as it writes,
+    or while the chunks are joined. Only the OpenCV writer on an unsplit
+    render needs a separate remux pass. Without an ffmpeg binary the
+    output has video only.
+
+    With skip_untouched, GOPs without a pixel in any mapping's range are
+    stream-copied and only the others are re-encoded (see render_spliced).
+    This needs a source the encoder's output can be spliced with; for any
+    other source the whole video is re-encoded as usual.
+
+    progress, if given, is called from the exporting thread with the number
+    of frames finished since its previous call. Setting the threading.Event
+    cancel aborts the render with ExportCancelled. On any failure the
+    partially written dst_path is removed.
+
+    Returns the PipelineStats of the whole render.
+    """
+    cpus = os.cpu_count() or 1
+    if workers is None:
+        workers = cpus
+
+    frame_count = probe(src_path).frame_count
+
+    if workers > 1 and find_ffmpeg() is not None:
+        chunks = plan_chunks(frame_count, workers, keyframe_indices(src_path))
+    else:
+        chunks = [(0, None)]
+    if transform_threads is None:
+        transform_threads = max(1, cpus // len(chunks))
+    # Resolved once here, so every chunk is written with the same encoder
+    # and the segments can be joined without re-encoding
+    encoder = resolve_encoder(encoder)
+    if encoder.threads is None and len(chunks) > 1:
+        encoder = encoder._replace(threads=max(1, cpus // len(chunks)))
+    options = dict(transform_threads=transform_threads, queue_depth=queue_depth,
+                   decoder=decoder, decode_threads=decode_threads, encoder=encoder, engine=engine)
+    if passthrough and find_ffmpeg() is not None:
+        passthrough = (src_path, passthrough_args(src_path, dst_path))
+    else:
+        passthrough = None
+
+    try:
+        gops = splice_gops(src_path, encoder) if skip_untouched else None
+        if gops is not None:
+            return render_spliced(src_path, dst_path, mappings, gops, workers, options,
+                                  passthrough, progress, cancel)
+        if len(chunks) > 1 or (passthrough is not None and not ENCODERS[encoder.encoder].supports_passthrough):
+            # Segments, or a single one that still needs its tracks copied,
+            # are joined into dst_path
+            return render_chunks(src_path, dst_path, mappings, chunks, options, passthrough, progress, cancel)
+        return render_chunk(src_path, dst_path, mappings, passthrough=passthrough,
+                            progress=progress, cancel=cancel, **options)
+    except BaseException:
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        raise
+
+
+def run_in_workers(jobs, workers, progress=None, cancel=None):
+    """
+    Runs (function, args, kwargs) jobs in a pool of worker processes and
+    returns their results in order. Each function also gets progress and
+    cancel keyword arguments for a ProgressReporter.
+
+    Worker processes report progress through a managed queue and watch a
+    managed copy of the cancel event, which is relayed from this thread.
+    Raises ExportCancelled once cancel is set.
+    """
+    with multiprocessing.Manager() as manager:
+        progress_queue = manager.Queue()
+        worker_cancel = manager.Event()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(function, *args, progress=progress_queue.put, cancel=worker_cancel, **kwargs)
+                for function, args, kwargs in jobs
+            ]
+            while not all(f.done() for f in futures):
+                try:
+                    done = progress_queue.get(timeout=PROGRESS_INTERVAL)
+                    if progress is not None:
+                        progress(done)
+                except queue.Empty:
+                    pass
+                if cancel is not None and cancel.is_set():
+                    worker_cancel.set()
+            while not progress_queue.empty():
+                done = progress_queue.get()
+                if progress is not None:
+                    progress(done)
+            results = [f.result() for f in futures]
+    if cancel is not None and cancel.is_set():
+        raise ExportCancelled()
+    return results
+
+
+def render_chunks(src_path, dst_path, mappings, chunks, options, passthrough=None, progress=None, cancel=None):
+    # options are the keyword arguments every render_chunk call gets.
+    # passthrough tracks are copied in while the segments are joined.
+    began = time.perf_counter()
+    stats = PipelineStats()
+    stats.threads = dict.fromkeys(STAGES, 0)
+    _, ext = os.path.splitext(dst_path)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(dst_path))) as tmp_dir:
+        segment_paths = [os.path.join(tmp_dir, f"segment_{i:04d}{ext}") for i in range(len(chunks))]
+        jobs = [(render_chunk, (src_path, path, mappings, start, stop), options)
+                for path, (start, stop) in zip(segment_paths, chunks)]
+        for chunk_stats in run_in_workers(jobs, len(chunks), progress, cancel):
+            stats.merge(chunk_stats)
+        concat_segments(segment_paths, dst_path, passthrough)
+    stats.wall_time = time.perf_counter() - began
+    return stats
+
+
+def splice_gops(src_path, encoder):
+    """
+    Returns the (start, stop) frame ranges of the GOPs of src_path if its
+    GOPs can be spliced with ones the resolved EncoderSettings encoder
+    writes, else None.
+
+    That takes the ffmpeg writer, a source in the SPLICE_CODECS codec of
+    the encoder with the same pixel format, and known keyframes. GOPs are
+    assumed to be closed, as encoders write them by default.
+    """
+    if find_ffmpeg() is None or encoder.encoder != "ffmpeg":
+        return None
+    source_format = video_format(src_path)
+    if source_format is None:
+        return None
+    codec, pix_fmt = source_format
+    if SPLICE_CODECS.get(codec) != encoder.codec or pix_fmt != CODEC_PIX_FMTS.get(encoder.codec):
+        return None
+    keyframes = keyframe_indices(src_path)
+    if not keyframes or keyframes[0] != 0:
+        return None
+    return list(zip(keyframes, keyframes[1:] + [None]))
+
+
+def analyze_gops(src_path, mappings, gops, decoder=DEFAULT_DECODER, decode_threads=None,
+                 progress=None, cancel=None):
+    """
+    Returns (touched, stats) for consecutive (start, stop) GOPs: touched[i]
+    is True if the mappings change a pixel of GOP i. The rest of a GOP is
+    skipped after its first touched frame.
+
+    Frames of untouched GOPs are reported as progress, since they need no
+    further work. Runs inside worker processes; mappings are normalized
+    mappings, as no lookup table is needed.
+    """
+    reporter = ProgressReporter(progress, cancel)
+    stats = PipelineStats()
+    stats.threads["encode"] = 0
+    clock = time.perf_counter
+    began = clock()
+    touched = []
+    source = open_source(src_path, decoder, decode_threads)
+    try:
+        if gops[0][0]:
+            source.seek(gops[0][0])
+        for start, stop in gops:
+            hit = False
+            frames = 0
+            while stop is None or start + frames < stop:
+                t0 = clock()
+                if hit:
+                    more = source.grab()
+                else:
+                    frame = source.read()
+                    more = frame is not None
+                t1 = clock()
+                stats.busy["decode"] += t1 - t0
+                if not more:
+                    break
+                if not hit:
+                    hit = frame_touched(frame, mappings)
+                    stats.busy["transform"] += clock() - t1
+                frames += 1
+            touched.append(hit)
+            if not hit:
+                reporter.frame_done(frames)
+                stats.frames += frames
+                stats.copied += frames
+        reporter.report()
+    finally:
+        source.release()
+    stats.wall_time = clock() - began
+    return touched, stats
+
+
+def split_at_keyframes(src_path, frames, pattern):
+    """
+    Starts an ffmpeg process that stream-copies the video of src_path into
+    MP4 files pattern % 0, pattern % 1, ..., cut at the keyframes with the
+    given (ascending) frame indices. Returns the Popen.
+    """
+    cmd = [find_ffmpeg(), "-v", "error", "-y", "-i", src_path, "-map", "0:v:0", "-c", "copy",
+           "-f", "segment", "-segment_format", "mp4", "-reset_timestamps", "1",
+           "-segment_frames", ",".join(str(f) for f in frames), pattern]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def render_spliced(src_path, dst_path, mappings, gops, workers, options, passthrough=None,
+                   progress=None, cancel=None):
+    """
+    Re-encodes only the GOPs the mappings touch and stream-copies the rest.
+
+    The GOPs are analysed in worker processes and consecutive GOPs with the
+    same result are grouped into runs, splitting long touched runs between
+    the workers. Touched runs are rendered like
+    chunks, while ffmpeg cuts the source at the run boundaries alongside.
+    When joining, the concat demuxer converts each piece to Annex B with
+    its own parameter sets in-band, so copied and re-encoded pieces play
+    back correctly although their encoder settings differ.
+    """
+    began = time.perf_counter()
+    stats = PipelineStats()
+    stats.threads = dict.fromkeys(STAGES, 0)
+    if isinstance(mappings, ColorTransformPipeline):
+        ranges = mappings.mappings
+    else:
+        ranges = normalize_mappings(mappings)
+
+    # Analyse contiguous groups of GOPs, one per worker
+    groups = max(1, min(workers, len(gops)))
+    bounds = [i * len(gops) // groups for i in range(groups + 1)]
+    jobs = [(analyze_gops, (src_path, ranges, gops[a:b]),
+             dict(decoder=options["decoder"], decode_threads=options["decode_threads"]))
+            for a, b in zip(bounds, bounds[1:])]
+    touched = []
+    for group_touched, group_stats in run_in_workers(jobs, groups, progress, cancel):
+        touched += group_touched
+        stats.merge(group_stats)
+
+    # Touched runs are capped at their share of the work per worker, so
+    # mostly touched footage still renders on every worker
+    touched_frames = sum((stop or start + MIN_CHUNK_FRAMES) - start
+                         for (start, stop), hit in zip(gops, touched) if hit)
+    max_run = max(MIN_CHUNK_FRAMES, touched_frames // max(1, workers))
+    runs = []
+    for (start, stop), hit in zip(gops, touched):
+        if runs and runs[-1][2] == hit and not (hit and start - runs[-1][0] >= max_run):
+            runs[-1] = (runs[-1][0], stop, hit)
+        else:
+            runs.append((start, stop, hit))
+
+    if not any(hit for _, _, hit in runs):
+        # Nothing to re-encode; the video is copied as a whole
+        concat_segments([src_path], dst_path, passthrough)
+        stats.wall_time = time.perf_counter() - began
+        return stats
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(dst_path))) as tmp_dir:
+        copy_pattern = os.path.join(tmp_dir, "copy_%04d.mp4")
+        pieces = [os.path.join(tmp_dir, f"encode_{i:04d}.mp4") if hit else copy_pattern % i
+                  for i, (_, _, hit) in enumerate(runs)]
+        splitter = None
+        if len(runs) > 1:
+            splitter = split_at_keyframes(src_path, [start for start, _, _ in runs[1:]], copy_pattern)
+        try:
+            jobs = [(render_chunk, (src_path, piece, mappings, start, stop), options)
+                    for piece, (start, stop, hit) in zip(pieces, runs) if hit]
+            for run_stats in run_in_workers(jobs, max(1, min(workers, len(jobs))), progress, cancel):
+                stats.merge(run_stats)
+        except BaseException:
+            if splitter is not None:
+                splitter.kill()
+                splitter.communicate()
+            raise
+        if splitter is not None:
+            _, message = splitter.communicate()
+            if splitter.returncode != 0:
+                raise IOError(f"Could not split {src_path}: {message.decode(errors='replace').strip()}")
+        concat_segments(pieces, dst_path, passthrough)
+    stats.wall_time = time.perf_counter() - began
+    return stats
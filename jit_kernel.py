@@ -0,0 +1,49 @@
+"""
+Numba-compiled transform kernel used by the "jit" engine in color_engine.
+
+Importing this module requires numba, which is optional; color_engine only
+imports it on first use and falls back to NumPy without it. Compiled code
+is cached to disk (cache=True), so only the first run after an install or
+an edit of this file pays for compilation.
+"""
+import os
+
+import numba
+
+# Numba's built-in workqueue layer comes first unless NUMBA_THREADING_LAYER
+# says otherwise. GNU OpenMP aborts in processes forked after it started,
+# which export workers are, and a TBB pool first started off the main
+# thread (e.g. by the prefetch thread) hangs the interpreter on exit.
+# Workqueue kernels must not run concurrently, so color_engine serializes
+# the launches.
+if "NUMBA_THREADING_LAYER" not in os.environ and "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+    numba.config.THREADING_LAYER_PRIORITY = ["workqueue", "omp", "tbb"]
+
+
+@numba.njit(parallel=True, cache=True, nogil=True)
+def fused_transform(src, dst, tables, highest_bit, palette, copy):
+    """
+    Classifies and recolors a BGR frame in one pass over its rows in
+    parallel, reading every source pixel and writing every output pixel
+    once.
+
+    tables and palette come from color_engine.compile_bitmasks and
+    make_palette, highest_bit from _get_highest_bit_table. Pixels outside
+    every mapping are copied from src when copy is set; pass copy=False
+    when dst is src.
+    """
+    h, w = src.shape[0], src.shape[1]
+    for y in numba.prange(h):
+        for x in range(w):
+            b = src[y, x, 0]
+            g = src[y, x, 1]
+            r = src[y, x, 2]
+            label = highest_bit[tables[0, b, 0] & tables[0, g, 1] & tables[0, r, 2]]
+            if label:
+                dst[y, x, 0] = palette[label, 0]
+                dst[y, x, 1] = palette[label, 1]
+                dst[y, x, 2] = palette[label, 2]
+            elif copy:
+                dst[y, x, 0] = b
+                dst[y, x, 1] = g
+                dst[y, x, 2] = r
@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# Default memory budget of the decoded frame cache
+FRAME_CACHE_MB = 512
+
+# Default number of frames the prefetch thread decodes ahead
+PREFETCH_DEPTH = 8
+
+
+class FrameCache:
+    """
+    Memory-bounded cache of decoded source frames, keyed by frame index.
+
+    When the budget is exceeded the frame farthest from the playhead is
+    evicted first (least recently used among equals), so the section around
+    the current position survives while replaying it. Cached frames are
+    shared, so callers must not modify them in place.
+    """
+    def __init__(self, max_mb=FRAME_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.frames = OrderedDict()
+        self.size = 0
+        self.playhead = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __str__(self):
+        return (f"{len(self.frames)} frames, {self.size / (1024 * 1024):.0f}/"
+                f"{self.max_bytes / (1024 * 1024):.0f} MB, {self.hits} hits, "
+                f"{self.misses} misses ({self.hit_rate:.0%} hit rate)")
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, index):
+        frame = self.frames.get(index)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.frames.move_to_end(index)
+        return frame
+
+    def put(self, index, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        old = self.frames.pop(index, None)
+        if old is not None:
+            self.size -= old.nbytes
+        self.frames[index] = frame
+        self.size += frame.nbytes
+        while self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # max() returns the first of equal candidates, i.e. the least recently used
+        index = max(self.frames, key=lambda i: abs(i - self.playhead))
+        self.size -= self.frames.pop(index).nbytes
+
+    def clear(self):
+        self.frames.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+class PlaybackClock:
+    """
+    Schedules playback against a monotonic clock at the source frame rate.
+
+    Frame i of a run is due origin_time + (i - origin_index) / fps, so timer
+    jitter and slow frames never accumulate into drift. When processing
+    falls behind, the caller jumps ahead to due_index() and records the
+    frames it skipped as dropped.
+    """
+    def __init__(self, fps):
+        self.fps = fps
+        self.origin_time = 0.0
+        self.origin_index = 0
+        self.shown = 0
+        self.dropped = 0
+
+    def start(self, index):
+        self.origin_time = time.monotonic()
+        self.origin_index = index
+        self.shown = 0
+        self.dropped = 0
+
+    def due_index(self):
+        return self.origin_index + int((time.monotonic() - self.origin_time) * self.fps)
+
+    def delay_ms(self, index):
+        """Milliseconds until frame index is due (0 if it is already late)."""
+        due_time = self.origin_time + (index - self.origin_index) / self.fps
+        return max(0, int(round((due_time - time.monotonic()) * 1000)))
+
+    @property
+    def achieved_fps(self):
+        elapsed = time.monotonic() - self.origin_time
+        return self.shown / elapsed if elapsed > 0 else 0.0
+
+
+class PrefetchReader:
+    """
+    Decodes frames ahead of playback on a dedicated thread.
+
+    read_frame(index) is called on the reader thread for consecutive
+    indices from start_index and must return a frame, or None at the end of
+    the video. Results land in a bounded queue as (index, frame, transformed)
+    tuples, where transformed is transform(frame) when a transform is given
+    and None otherwise. While the reader runs it owns whatever read_frame
+    touches; stop() it before using those from another thread.
+    """
+    def __init__(self, read_frame, start_index, depth=PREFETCH_DEPTH, transform=None):
+        self.read_frame = read_frame
+        self.transform = transform
+        self.frames = queue.Queue(maxsize=depth)
+        self.next_index = start_index
+        self.skip_index = None
+        self.eof = False
+        self.error = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                skip = self.skip_index
+                if skip is not None and skip > self.next_index:
+                    self.next_index = skip
+                index = self.next_index
+                frame = self.read_frame(index)
+                if frame is None:
+                    break
+                transformed = self.transform(frame) if self.transform is not None else None
+                if not self.put((index, frame, transformed)):
+                    return
+                self.next_index = index + 1
+        except Exception as e:
+            self.error = e
+        self.eof = True
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get_nowait(self):
+        """Returns the next ready frame tuple, or None if none is ready yet."""
+        try:
+            return self.frames.get_nowait()
+        except queue.Empty:
+            return None
+
+    @property
+    def finished(self):
+        # True once the reader stopped and every frame it read was taken
+        return self.eof and self.frames.empty()
+
+    def skip_to(self, index):
+        """Asks the reader to continue at index if it is still behind it."""
+        self.skip_index = index
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -0,0 +1,985 @@
+import time
+import threading
+import cv2
+import numpy as np
+from PyQt5.QtWidgets import (QWidget, QLabel, QSlider, QHBoxLayout, QVBoxLayout, 
+                             QPushButton, QFileDialog, QMessageBox, QGroupBox, QColorDialog, QFrame, QScrollArea,
+                             QProgressBar, QCheckBox, QComboBox)
+from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QImage, QColor, QPalette, QGuiApplication, QPainter
+
+from color_engine import ColorTransformPipeline, ENGINES, MAX_MAPPINGS
+from export import export_video, ExportCancelled
+from presets import load_pipeline, save_preset, save_binary_preset
+from video_io import open_source, DEFAULT_DECODER
+from playback import FrameCache, PlaybackClock, PrefetchReader, FRAME_CACHE_MB, PREFETCH_DEPTH
+from profiling import StageProfiler
+
+PRESET_FILTER = "JSON Preset (*.json);;Compiled Preset (*.cmap)"
+SAVE_FILTER = "MP4 Files (*.mp4);;Matroska Files (*.mkv)"
+
+# Rebuilds in microseconds, so slider drags never wait on a table compile
+# (MAX_MAPPINGS is within its limit)
+PLAYER_ENGINE = "bitmask"
+
+# Qt 5.14+ can wrap BGR frames as they come from OpenCV; older versions need
+# a conversion to RGB first
+QIMAGE_FORMAT_BGR888 = getattr(QImage, "Format_BGR888", None)
+
+# Interpolations offered for scaling the preview down to the display size
+PREVIEW_INTERPOLATIONS = [
+    ("Linear", cv2.INTER_LINEAR),
+    ("Nearest", cv2.INTER_NEAREST),
+    ("Area", cv2.INTER_AREA),
+]
+
+# Refresh rate assumed when the screen does not report one
+DEFAULT_REFRESH_RATE = 60.0
+
+# Frame rate assumed when the video does not report one
+DEFAULT_FPS = 30.0
+
+# Skips up to this many frames are done by grabbing forward; longer ones seek
+MAX_GRAB_SKIP = 30
+
+# Seconds between updates of the playback fps readout
+STATUS_INTERVAL = 0.5
+
+# Milliseconds to wait before polling again when no prefetched frame is ready
+PREFETCH_RETRY_MS = 2
+
+# Stages of showing a frame that the stats overlay times: decoding (or the
+# cache lookup), scaling to the preview size, the mapping transform, wrapping
+# the result for Qt and painting it
+PREVIEW_STAGES = ("decode", "scale", "transform", "convert", "paint")
+
+class ColorMappingWidget(QGroupBox):
+    """
+    A widget representing a single color mapping:
+    - Sliders for lower and upper B/G/R thresholds
+    - A color picker for the replacement color
+    - A remove button
+    
+    Emits changes via callbacks passed in constructor.
+    """
+    def __init__(self, index, remove_callback, update_callback):
+        super().__init__(f"Color Mapping #{index+1}")
+        
+        self.index = index
+        self.remove_callback = remove_callback
+        self.update_callback = update_callback
+
+        self.lower_color = np.array([200, 200, 200], dtype=np.uint8)
+        self.upper_color = np.array([255, 255, 255], dtype=np.uint8)
+        self.new_line_color = [0, 255, 0]
+
+        # Create sliders
+        self.l_b_slider = self.create_slider(self.lower_color[0], self.slider_changed)
+        self.l_g_slider = self.create_slider(self.lower_color[1], self.slider_changed)
+        self.l_r_slider = self.create_slider(self.lower_color[2], self.slider_changed)
+
+        self.u_b_slider = self.create_slider(self.upper_color[0], self.slider_changed)
+        self.u_g_slider = self.create_slider(self.upper_color[1], self.slider_changed)
+        self.u_r_slider = self.create_slider(self.upper_color[2], self.slider_changed)
+
+        # Color picker button
+        self.color_btn = QPushButton("Pick Replacement Color")
+        self.color_btn.clicked.connect(self.pick_color)
+
+        # Remove button
+        self.remove_btn = QPushButton("Remove")
+        self.remove_btn.clicked.connect(lambda: self.remove_callback(self.index))
+
+        # Layout
+        # Sliders layout
+        sliders_layout = QVBoxLayout()
+
+        sliders_layout.addWidget(QLabel("Lower B:"))
+        sliders_layout.addWidget(self.l_b_slider)
+        sliders_layout.addWidget(QLabel("Lower G:"))
+        sliders_layout.addWidget(self.l_g_slider)
+        sliders_layout.addWidget(QLabel("Lower R:"))
+        sliders_layout.addWidget(self.l_r_slider)
+
+        sliders_layout.addWidget(QLabel("Upper B:"))
+        sliders_layout.addWidget(self.u_b_slider)
+        sliders_layout.addWidget(QLabel("Upper G:"))
+        sliders_layout.addWidget(self.u_g_slider)
+        sliders_layout.addWidget(QLabel("Upper R:"))
+        sliders_layout.addWidget(self.u_r_slider)
+
+        # Buttons layout
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(self.color_btn)
+        btn_layout.addWidget(self.remove_btn)
+
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(sliders_layout)
+        main_layout.addLayout(btn_layout)
+        self.setLayout(main_layout)
+
+        self.update_style()
+
+    def create_slider(self, init_val, slot):
+        s = QSlider(Qt.Horizontal)
+        s.setRange(0, 255)
+        s.setValue(init_val)
+        s.valueChanged.connect(slot)
+        return s
+
+    def slider_changed(self):
+        # Called for every step of a drag, so update the arrays in place and
+        # leave it to the player to coalesce the resulting preview refreshes
+        self.lower_color[:] = (
+            self.l_b_slider.value(),
+            self.l_g_slider.value(),
+            self.l_r_slider.value()
+        )
+
+        self.upper_color[:] = (
+            self.u_b_slider.value(),
+            self.u_g_slider.value(),
+            self.u_r_slider.value()
+        )
+
+        self.update_callback()
+
+    def mapping(self):
+        # Snapshot of this mapping as (lower, upper, new_color) for the pipeline
+        return (self.lower_color, self.upper_color, self.new_line_color)
+
+    def set_mapping(self, lower, upper, new_color):
+        # Set all sliders at once without a callback per slider
+        sliders = (self.l_b_slider, self.l_g_slider, self.l_r_slider,
+                   self.u_b_slider, self.u_g_slider, self.u_r_slider)
+        for slider, value in zip(sliders, tuple(lower) + tuple(upper)):
+            slider.blockSignals(True)
+            slider.setValue(value)
+            slider.blockSignals(False)
+        self.lower_color = np.array(lower, dtype=np.uint8)
+        self.upper_color = np.array(upper, dtype=np.uint8)
+        self.new_line_color = list(new_color)
+
+    def pick_color(self):
+        color = QColorDialog.getColor(QColor(*self.new_line_color), self, "Pick Replacement Color")
+        if color.isValid():
+            self.new_line_color = [color.blue(), color.green(), color.red()]
+            self.update_callback()
+
+    def update_style(self):
+        # A slightly more modern look
+        self.setStyleSheet("""
+            QGroupBox {
+                border: 1px solid #ccc;
+                border-radius: 5px;
+                margin-top: 10px;
+                font: 13px 'Arial';
+            }
+            QGroupBox::title {
+                subcontrol-origin: margin;
+                subcontrol-position: top center;
+                padding: 0 3px;
+                background-color: #f0f0f0;
+                border-radius: 3px;
+            }
+            QLabel {
+                font: 12px 'Arial';
+            }
+            QPushButton {
+                background-color: #e1e1e1;
+                border: 1px solid #aaa;
+                border-radius: 3px;
+                padding: 3px 6px;
+            }
+            QPushButton:hover {
+                background-color: #d7d7d7;
+            }
+        """)
+
+
+class VideoLabel(QLabel):
+    """
+    A label that paints video frames straight from their numpy buffers.
+
+    set_frame wraps the BGR frame in a QImage without copying it (or, on Qt
+    versions without Format_BGR888, converts it into a reused RGB buffer),
+    keeps the array alive while the image is shown, and paints the image
+    directly instead of converting it into a QPixmap every frame.
+
+    With fit set the label no longer grows to the frame size; frames are
+    expected to be scaled to the label instead, and resized is emitted
+    whenever that size changes.
+
+    With a profiler set, wrapping and painting frames are timed as its
+    convert and paint stages. set_hud shows lines of text over the frame.
+    """
+    resized = pyqtSignal()
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self.frame = None
+        self.image = None
+        self.rgb_buffer = None
+        self.fit = False
+        self.profiler = None
+        self.hud_lines = None
+
+    def set_fit(self, fit):
+        self.fit = fit
+        self.updateGeometry()
+
+    def set_hud(self, lines):
+        # None or an empty list hides the overlay
+        self.hud_lines = lines
+        self.update()
+
+    def set_frame(self, frame):
+        began = self.profiler.begin() if self.profiler is not None else None
+        frame = np.ascontiguousarray(frame)
+        h, w = frame.shape[:2]
+        if QIMAGE_FORMAT_BGR888 is not None:
+            image_format = QIMAGE_FORMAT_BGR888
+        else:
+            if self.rgb_buffer is None or self.rgb_buffer.shape != frame.shape:
+                self.rgb_buffer = np.empty_like(frame)
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb_buffer)
+            image_format = QImage.Format_RGB888
+
+        resized = self.image is None or self.image.width() != w or self.image.height() != h
+        # The QImage only references the buffer, so hold on to the array too
+        self.frame = frame
+        self.image = QImage(frame.data, w, h, frame.strides[0], image_format)
+        if began is not None:
+            self.profiler.end("convert", began)
+        if self.text():
+            self.clear()
+        if resized:
+            self.updateGeometry()
+        self.update()
+
+    def sizeHint(self):
+        if self.image is None or self.fit:
+            return super().sizeHint()
+        return self.image.size()
+
+    def minimumSizeHint(self):
+        if self.fit:
+            return super().minimumSizeHint()
+        return self.sizeHint()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.image is None:
+            return
+        began = self.profiler.begin() if self.profiler is not None else None
+        painter = QPainter(self)
+        x = (self.width() - self.image.width()) // 2
+        y = (self.height() - self.image.height()) // 2
+        painter.drawImage(x, y, self.image)
+        if began is not None:
+            self.profiler.end("paint", began)
+        if self.hud_lines:
+            self.paint_hud(painter)
+        painter.end()
+
+    def paint_hud(self, painter):
+        # Light text on a translucent box in the top-left corner
+        metrics = painter.fontMetrics()
+        line_height = metrics.height()
+        width = max(metrics.width(line) for line in self.hud_lines) + 12
+        painter.fillRect(4, 4, width, line_height * len(self.hud_lines) + 8, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(255, 255, 255))
+        for i, line in enumerate(self.hud_lines):
+            painter.drawText(10, 8 + metrics.ascent() + i * line_height, line)
+
+
+class ExportThread(QThread):
+    """
+    Runs export_video in the background so the player stays responsive.
+
+    Emits progress(frames_done, total_frames, fps, eta_seconds) while
+    rendering, then exactly one of finished_ok(stats), failed(message) or
+    cancelled().
+    """
+    progress = pyqtSignal(int, int, float, float)
+    finished_ok = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, src_path, dst_path, mappings, total_frames, parent=None, **options):
+        super().__init__(parent)
+        self.src_path = src_path
+        self.dst_path = dst_path
+        self.mappings = mappings
+        # Further keyword arguments of export_video (decoder, encoder, ...)
+        self.options = options
+        self.total_frames = total_frames
+        self.frames_done = 0
+        self.start_time = 0.0
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def on_progress(self, frames):
+        self.frames_done += frames
+        elapsed = time.monotonic() - self.start_time
+        fps = self.frames_done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total_frames - self.frames_done, 0)
+        eta = remaining / fps if fps > 0 else 0.0
+        self.progress.emit(self.frames_done, self.total_frames, fps, eta)
+
+    def run(self):
+        self.start_time = time.monotonic()
+        try:
+            stats = export_video(self.src_path, self.dst_path, self.mappings,
+                                 progress=self.on_progress, cancel=self.cancel_event, **self.options)
+        except ExportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished_ok.emit(stats)
+
+
+class VideoPlayer(QWidget):
+    def __init__(self, video_path=None, cache_mb=FRAME_CACHE_MB,
+                 prefetch_depth=PREFETCH_DEPTH, prefetch_transform=True,
+                 decoder=DEFAULT_DECODER, decode_threads=None, encoder=None, engine=PLAYER_ENGINE):
+        super().__init__()
+        self.setWindowTitle("Advanced Video Color Adjuster")
+
+        # Video attributes
+        self.source = None
+        self.video_path = None
+        self.decoder = decoder
+        self.decode_threads = decode_threads
+        self.encoder = encoder
+        # Playback ticks are single shots scheduled by the playback clock
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.playback_tick)
+        self.clock = PlaybackClock(DEFAULT_FPS)
+        self.last_status_time = 0.0
+        self.playing = False
+        self.export_thread = None
+
+        # Mapping edits only schedule a preview refresh; bursts of slider
+        # events within one display refresh collapse into a single recompute
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.refresh_interval_ms())
+        self.preview_timer.timeout.connect(self.refresh_preview)
+
+        # Store multiple mappings (each a ColorMappingWidget)
+        self.mappings = []
+
+        # Per-stage timing of the preview, only running while the stats
+        # overlay is shown
+        self.profiler = StageProfiler(PREVIEW_STAGES)
+
+        # Compiled transform shared by preview and export. Large preview
+        # frames are split into strips across the cores, which cuts the
+        # latency of a single frame; export parallelises across frames.
+        self.pipeline = ColorTransformPipeline(engine=engine, tiles=None)
+
+        # Last decoded (untransformed) frame, so paused previews can re-run
+        # the transform without touching the decoder, and the buffer the
+        # transformed preview is written into
+        self.source_frame = None
+        self.preview_buffer = None
+
+        # Preview frames are scaled down to the display size before the
+        # transform runs. preview_target is that size (None for full
+        # resolution); the prefetch thread reads it, so it is only ever
+        # replaced as a whole. The scaled copy of source_frame is kept too.
+        self.preview_target = None
+        self.preview_interpolation = PREVIEW_INTERPOLATIONS[0][1]
+        self.scaled_frame = None
+        self.scaled_from = None
+        self.scaled_target = None
+
+        # Recently decoded frames, so replaying a section is served from RAM.
+        # next_index is the frame update_frame shows next.
+        self.frame_cache = FrameCache(cache_mb)
+        self.next_index = 0
+
+        # While playing, frames are decoded (and optionally transformed) ahead
+        # on a separate thread, which then owns the capture and the cache
+        self.prefetch = None
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_transform = prefetch_transform
+
+        # Create UI
+        self.init_ui()
+
+        # If a video path is provided at start
+        if video_path:
+            self.load_new_video(video_path)
+
+    def init_ui(self):
+        # Instructions
+        instructions = QLabel(
+            "Instructions:\n"
+            "1. Click 'Load Video' to select a video file.\n"
+            "2. Use the 'Add Color Mapping' button to add up to 10 color transformations.\n"
+            "3. For each mapping, adjust the B/G/R lower and upper sliders to target a specific original color range in the video.\n"
+            "4. Click 'Pick Replacement Color' to choose the new color for that range.\n"
+            "5. Press 'Play' to preview changes. Adjust sliders as needed until the desired look is achieved.\n"
+            "6. When satisfied, click 'Apply & Save' to render and save a new video with all changes applied.\n"
+            "\n"
+            "Tips:\n"
+            "- Add multiple mappings to change multiple colors simultaneously.\n"
+            "- Removal of a mapping resets that transformation.\n"
+            "- The displayed frame updates live (when paused) or as the video plays.\n"
+        )
+        instructions.setStyleSheet("font: 12px 'Arial';")
+
+        self.video_label = VideoLabel("No Video Loaded")
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.video_label.setStyleSheet("background-color: white; border: 1px solid #ddd;")
+
+        self.video_label.resized.connect(self.preview_size_changed)
+        self.video_label.profiler = self.profiler
+
+        # Preview scaling: process at display resolution, export at full
+        self.fit_check = QCheckBox("Fit preview to window")
+        self.fit_check.setToolTip("Scale frames to the display size before applying the mappings.\n"
+                                  "Apply & Save always renders at full resolution.")
+        self.fit_check.toggled.connect(self.preview_size_changed)
+        self.interpolation_combo = QComboBox()
+        for name, _ in PREVIEW_INTERPOLATIONS:
+            self.interpolation_combo.addItem(name)
+        self.interpolation_combo.setToolTip("Nearest keeps exact source colors at range edges;\n"
+                                            "Linear and Area look smoother.")
+        self.interpolation_combo.currentIndexChanged.connect(self.interpolation_changed)
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(list(ENGINES))
+        self.engine_combo.setCurrentText(self.pipeline.engine)
+        self.engine_combo.setToolTip("Transform engine. bitmask (the default) is fast per frame and\n"
+                                     "rebuilds instantly after each edit; lut takes a moment to rebuild.")
+        self.engine_combo.currentTextChanged.connect(self.engine_changed)
+
+        self.hud_check = QCheckBox("Show stats")
+        self.hud_check.setToolTip("Overlay the frame rate, dropped frames, the time each stage\n"
+                                  "of showing a frame takes (median / 95th percentile / worst)\n"
+                                  "and how often the frame cache was hit.")
+        self.hud_check.toggled.connect(self.hud_toggled)
+
+        # Achieved vs. target frame rate while playing
+        self.playback_status = QLabel()
+        self.playback_status.setAlignment(Qt.AlignRight)
+
+        # Buttons
+        self.load_btn = QPushButton("Load Video")
+        self.load_btn.clicked.connect(self.load_video)
+        self.play_btn = QPushButton("Play")
+        self.play_btn.clicked.connect(self.toggle_play)
+        self.apply_btn = QPushButton("Apply & Save")
+        self.apply_btn.clicked.connect(self.apply_and_save)
+        self.skip_untouched_check = QCheckBox("Copy untouched sections")
+        self.skip_untouched_check.setToolTip("Stream-copy the parts of an H.264 video no mapping changes\n"
+                                             "and re-encode only the rest.")
+        self.load_preset_btn = QPushButton("Load Preset")
+        self.load_preset_btn.clicked.connect(self.load_mapping_preset)
+        self.save_preset_btn = QPushButton("Save Preset")
+        self.save_preset_btn.clicked.connect(self.save_mapping_preset)
+
+        # Export progress, only shown while a render is running
+        self.export_progress = QProgressBar()
+        self.export_status = QLabel()
+        self.cancel_export_btn = QPushButton("Cancel")
+        self.cancel_export_btn.clicked.connect(self.cancel_export)
+        export_layout = QHBoxLayout()
+        export_layout.addWidget(self.export_progress)
+        export_layout.addWidget(self.export_status)
+        export_layout.addWidget(self.cancel_export_btn)
+        self.export_frame = QFrame()
+        self.export_frame.setLayout(export_layout)
+        self.export_frame.hide()
+
+        self.add_mapping_btn = QPushButton("Add Color Mapping")
+        self.add_mapping_btn.clicked.connect(self.add_mapping)
+
+        # Layout for color mappings
+        self.mappings_layout = QVBoxLayout()
+        self.mappings_layout.addWidget(self.add_mapping_btn)
+        self.mappings_layout.addStretch(1)
+
+        # Put mappings in a scroll area in case we have many
+        scroll_widget = QWidget()
+        scroll_widget.setLayout(self.mappings_layout)
+        scroll = QScrollArea()
+        scroll.setWidget(scroll_widget)
+        scroll.setWidgetResizable(True)
+        scroll.setStyleSheet("background: #fafafa; border:1px solid #ccc;")
+
+        # Buttons layout
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(self.load_btn)
+        btn_layout.addWidget(self.play_btn)
+        btn_layout.addWidget(self.apply_btn)
+        btn_layout.addWidget(self.skip_untouched_check)
+        btn_layout.addWidget(self.load_preset_btn)
+        btn_layout.addWidget(self.save_preset_btn)
+
+        main_layout = QVBoxLayout()
+        # Instructions frame
+        instructions_frame = QFrame()
+        instructions_frame.setFrameShape(QFrame.StyledPanel)
+        instructions_frame.setLayout(QVBoxLayout())
+        instructions_frame.layout().addWidget(instructions)
+
+        main_layout.addWidget(instructions_frame)
+        preview_layout = QHBoxLayout()
+        preview_layout.addWidget(self.fit_check)
+        preview_layout.addWidget(self.interpolation_combo)
+        preview_layout.addWidget(self.engine_combo)
+        preview_layout.addWidget(self.hud_check)
+        preview_layout.addStretch(1)
+        preview_layout.addWidget(self.playback_status)
+
+        main_layout.addWidget(self.video_label, 1)
+        main_layout.addLayout(preview_layout)
+        main_layout.addLayout(btn_layout)
+        main_layout.addWidget(self.export_frame)
+        main_layout.addWidget(scroll)
+
+        self.setLayout(main_layout)
+        self.resize(1000, 700)
+        self.fit_check.setChecked(True)
+
+        self.update_style()
+
+    def update_style(self):
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #fdfdfd;
+                font: 14px 'Arial';
+            }
+            QPushButton {
+                background-color: #eee;
+                border: 1px solid #aaa;
+                border-radius: 4px;
+                padding: 4px 8px;
+            }
+            QPushButton:hover {
+                background-color: #ddd;
+            }
+            QLabel {
+                font: 13px 'Arial';
+            }
+        """)
+
+    def add_mapping(self):
+        if len(self.mappings) >= MAX_MAPPINGS:
+            QMessageBox.warning(self, "Limit Reached", f"You can only add up to {MAX_MAPPINGS} color mappings.")
+            return
+
+        index = len(self.mappings)
+        mapping_widget = ColorMappingWidget(index, self.remove_mapping, self.mapping_changed)
+        self.mappings.insert(index, mapping_widget)
+        self.mappings_layout.insertWidget(index, mapping_widget)
+        return mapping_widget
+
+    def remove_mapping(self, index):
+        # Remove the mapping widget and entry
+        widget = self.mappings[index]
+        self.mappings_layout.removeWidget(widget)
+        widget.deleteLater()
+        self.mappings.pop(index)
+
+        # Re-label subsequent mappings
+        for i, mw in enumerate(self.mappings):
+            mw.setTitle(f"Color Mapping #{i+1}")
+            mw.index = i
+
+        self.mapping_changed()
+
+    def refresh_interval_ms(self):
+        screen = QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return int(1000 / (rate if rate > 0 else DEFAULT_REFRESH_RATE))
+
+    def mapping_changed(self):
+        # Schedule a refresh of the preview (or, while playing, of the
+        # pipeline the prefetch thread uses). The refresh reads the widgets
+        # when it fires, so the latest state always wins.
+        if not self.preview_timer.isActive():
+            self.preview_timer.start()
+
+    def refresh_preview(self):
+        if self.playing:
+            self.sync_pipeline()
+        elif self.source_frame is not None:
+            # Re-transform the cached frame; decoding would advance the video
+            self.show_frame()
+
+    def load_mapping_preset(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Preset", "", PRESET_FILTER)
+        if not path:
+            return
+        try:
+            pipeline = load_pipeline(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Could not load preset:\n{e}")
+            return
+
+        mappings, lut = pipeline.mappings, pipeline.lut
+        if len(mappings) > MAX_MAPPINGS:
+            QMessageBox.warning(self, "Limit Reached",
+                                f"Only the first {MAX_MAPPINGS} of {len(mappings)} color mappings were loaded.")
+            mappings, lut = mappings[:MAX_MAPPINGS], None
+
+        # Rebuild the widgets quietly, then refresh the preview once
+        for widget in self.mappings:
+            self.mappings_layout.removeWidget(widget)
+            widget.deleteLater()
+        self.mappings = []
+        for lower, upper, new_color in mappings:
+            self.add_mapping().set_mapping(lower, upper, new_color)
+        self.pipeline.set_mappings(mappings, lut)
+        self.mapping_changed()
+
+    def save_mapping_preset(self):
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Save Preset", "", PRESET_FILTER)
+        if not path:
+            return
+        pipeline = self.sync_pipeline()
+        try:
+            if path.lower().endswith(".cmap") or "cmap" in selected_filter:
+                save_binary_preset(path, pipeline.mappings, lut=pipeline.lut)
+            else:
+                save_preset(path, pipeline.mappings)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Could not save preset:\n{e}")
+
+    def preview_size_changed(self):
+        self.video_label.set_fit(self.fit_check.isChecked())
+        self.update_preview_target()
+        self.mapping_changed()
+
+    def engine_changed(self, engine):
+        self.pipeline.set_engine(engine)
+        self.mapping_changed()
+
+    def hud_toggled(self, checked):
+        self.profiler.set_enabled(checked)
+        if checked:
+            self.update_hud()
+        else:
+            self.video_label.set_hud(None)
+
+    def update_hud(self):
+        lines = []
+        if self.playing:
+            lines.append(f"{self.clock.achieved_fps:.1f} / {self.clock.fps:.1f} fps, "
+                         f"{self.clock.dropped} dropped")
+        lines += self.profiler.report() or ["no frames timed yet"]
+        lines.append(f"cache: {self.frame_cache}")
+        self.video_label.set_hud(lines)
+
+    def interpolation_changed(self, index):
+        self.preview_interpolation = PREVIEW_INTERPOLATIONS[index][1]
+        self.scaled_target = None  # rescale the paused frame
+        self.mapping_changed()
+
+    def update_preview_target(self):
+        # Largest size that fits the label with the frame's aspect ratio;
+        # frames are never scaled up
+        target = None
+        if self.fit_check.isChecked() and self.source is not None:
+            w, h = self.source.size
+            scale = min(self.video_label.width() / max(w, 1), self.video_label.height() / max(h, 1))
+            if scale < 1:
+                target = (max(1, int(w * scale)), max(1, int(h * scale)))
+        self.preview_target = target
+
+    def scale_for_preview(self, frame):
+        target = self.preview_target
+        if target is None or (frame.shape[1], frame.shape[0]) == target:
+            return frame
+        return cv2.resize(frame, target, interpolation=self.preview_interpolation)
+
+    def preview_transform(self, frame):
+        # Scale, then transform the small copy in place. Runs on the prefetch
+        # thread while playing.
+        began = self.profiler.begin()
+        scaled = self.scale_for_preview(frame)
+        began = self.profiler.end("scale", began)
+        if scaled is frame:
+            result = self.pipeline.process(frame)
+        else:
+            result = self.pipeline.process(scaled, out=scaled)
+        self.profiler.end("transform", began)
+        return result
+
+    def sync_pipeline(self):
+        # The pipeline only recompiles when a slider or color actually changed
+        self.pipeline.set_mappings(mw.mapping() for mw in self.mappings)
+        return self.pipeline
+
+    def load_video(self):
+        file_dialog = QFileDialog(self, "Select Video File")
+        file_dialog.setNameFilter("Video Files (*.mp4 *.avi *.mov)")
+        if file_dialog.exec_():
+            file_path = file_dialog.selectedFiles()[0]
+            self.load_new_video(file_path)
+
+    def load_new_video(self, file_path):
+        self.stop_prefetch()
+        if self.source is not None:
+            self.source.release()
+            self.source = None
+
+        try:
+            self.source = open_source(file_path, self.decoder, self.decode_threads)
+        except (IOError, ImportError):
+            QMessageBox.critical(self, "Error", "Could not open video.")
+            return
+        self.video_path = file_path
+        self.update_preview_target()
+        fps = self.source.fps
+        self.clock = PlaybackClock(fps if fps > 0 else DEFAULT_FPS)
+        self.playback_status.clear()
+        self.source_frame = None
+        self.frame_cache.clear()
+        self.next_index = 0
+        self.play_btn.setText("Play")
+        self.playing = False
+        self.timer.stop()
+        self.update_frame()  # Show first frame
+
+    def toggle_play(self):
+        if self.source is None:
+            return
+        self.playing = not self.playing
+        if self.playing:
+            self.play_btn.setText("Pause")
+            transform = None
+            if self.prefetch_transform:
+                self.sync_pipeline()
+                transform = self.preview_transform
+            self.prefetch = PrefetchReader(self.read_frame, self.next_index,
+                                           self.prefetch_depth, transform)
+            self.clock.start(self.next_index)
+            self.last_status_time = time.monotonic()
+            self.timer.start(0)
+        else:
+            self.play_btn.setText("Play")
+            self.timer.stop()
+            self.stop_prefetch()
+
+    def stop_prefetch(self):
+        # Hands the capture and the cache back to the GUI thread
+        if self.prefetch is not None:
+            self.prefetch.stop()
+            self.prefetch = None
+
+    def playback_tick(self):
+        # Ask the reader to jump ahead if it fell behind the clock, then show
+        # the newest ready frame that is not ahead of it, dropping older ones
+        due = self.clock.due_index()
+        if due > self.next_index:
+            self.prefetch.skip_to(due)
+        item = None
+        while item is None or item[0] < due:
+            newer = self.prefetch.get_nowait()
+            if newer is None:
+                break
+            item = newer
+
+        if item is None:
+            if self.prefetch.finished and self.prefetch.error is not None:
+                self.playback_failed(self.prefetch.error)
+            elif self.prefetch.finished:
+                self.end_of_video()
+            else:
+                self.timer.start(PREFETCH_RETRY_MS)
+            return
+
+        index, frame, transformed = item
+        self.clock.dropped += index - self.next_index
+        self.clock.shown += 1
+        self.next_index = index + 1
+        self.source_frame = frame
+        if transformed is not None:
+            self.display_frame(transformed)
+        else:
+            self.show_frame()
+
+        now = time.monotonic()
+        if now - self.last_status_time >= STATUS_INTERVAL:
+            self.last_status_time = now
+            self.playback_status.setText(
+                f"{self.clock.achieved_fps:.1f} / {self.clock.fps:.1f} fps, {self.clock.dropped} dropped")
+            if self.profiler.enabled:
+                self.update_hud()
+        self.timer.start(self.clock.delay_ms(self.next_index))
+
+    def update_frame(self):
+        # Decodes and shows the next frame on the GUI thread, while paused
+        if self.source is None or self.prefetch is not None:
+            return
+
+        frame = self.read_frame(self.next_index)
+        if frame is None:
+            self.end_of_video()
+            return
+        self.next_index += 1
+        self.source_frame = frame
+        self.show_frame()
+
+    def read_frame(self, index):
+        # Runs on the prefetch thread while playing. Returns None past the
+        # end of the video.
+        began = self.profiler.begin()
+        frame = self.fetch_frame(index)
+        self.profiler.end("decode", began)
+        return frame
+
+    def fetch_frame(self, index):
+        # Serve from the cache, and only seek the capture when it is not
+        # already positioned at the requested frame
+        self.frame_cache.playhead = index
+        frame = self.frame_cache.get(index)
+        if frame is not None:
+            return frame
+        source = self.source
+        if not source.eof and source.position < index <= source.position + MAX_GRAB_SKIP:
+            # Short skips while catching up: grab without converting frames
+            while source.position < index and source.grab():
+                pass
+        if source.eof or source.position != index:
+            source.seek(index)
+        frame = source.read()
+        if frame is not None:
+            self.frame_cache.put(index, frame)
+        return frame
+
+    def playback_failed(self, error):
+        # Pause where decoding or transforming failed instead of rewinding
+        self.timer.stop()
+        self.stop_prefetch()
+        self.playing = False
+        self.play_btn.setText("Play")
+        QMessageBox.critical(self, "Error", f"Playback stopped at frame {self.next_index}:\n{error}")
+
+    def end_of_video(self):
+        if self.playing:
+            self.timer.stop()
+            self.stop_prefetch()
+        self.playing = False
+        self.play_btn.setText("Play")
+        self.next_index = 0  # rewind
+
+    def show_frame(self):
+        # Apply all mappings in one pass. Every mapping is tested against the
+        # original pixel color, and later mappings win where ranges overlap.
+        # The source frame is left untouched for later re-renders; only its
+        # copy scaled to the display size is transformed.
+        began = self.profiler.begin()
+        source = self.preview_source()
+        began = self.profiler.end("scale", began)
+        if self.preview_buffer is None or self.preview_buffer.shape != source.shape:
+            self.preview_buffer = np.empty_like(source)
+        frame = self.sync_pipeline().process(source, out=self.preview_buffer)
+        self.profiler.end("transform", began)
+        self.display_frame(frame)
+
+    def preview_source(self):
+        # source_frame scaled for the preview, rescaled only when the frame
+        # or the target size changed
+        target = self.preview_target
+        if self.scaled_from is not self.source_frame or self.scaled_target != target:
+            self.scaled_frame = self.scale_for_preview(self.source_frame)
+            self.scaled_from = self.source_frame
+            self.scaled_target = target
+        return self.scaled_frame
+
+    def display_frame(self, frame):
+        # Hand the BGR buffer to Qt without converting or copying it
+        self.video_label.set_frame(frame)
+        if self.profiler.enabled and not self.playing:
+            # While playing the overlay follows the fps readout instead
+            self.update_hud()
+
+    def apply_and_save(self):
+        if self.source is None:
+            QMessageBox.warning(self, "No Video", "No video loaded to apply changes.")
+            return
+
+        # Ask user for save path
+        save_path, _ = QFileDialog.getSaveFileName(self, "Save Video", "", SAVE_FILTER)
+        if not save_path:
+            return
+
+        # Render the entire video with current mappings in the background.
+        # Long videos are split across worker processes, each with its own
+        # capture and writer, so the preview capture is left untouched.
+        self.export_thread = ExportThread(self.video_path, save_path,
+                                          self.sync_pipeline().mappings, self.source.frame_count, self,
+                                          decoder=self.decoder, decode_threads=self.decode_threads,
+                                          encoder=self.encoder, engine=self.pipeline.engine,
+                                          skip_untouched=self.skip_untouched_check.isChecked())
+        self.export_thread.progress.connect(self.export_progressed)
+        self.export_thread.finished_ok.connect(self.export_finished)
+        self.export_thread.failed.connect(self.export_failed)
+        self.export_thread.cancelled.connect(self.export_cancelled)
+
+        self.export_progress.setRange(0, max(self.source.frame_count, 1))
+        self.export_progress.setValue(0)
+        self.export_status.setText("Starting...")
+        self.cancel_export_btn.setEnabled(True)
+        self.export_frame.show()
+        self.apply_btn.setEnabled(False)
+        self.load_btn.setEnabled(False)
+        self.export_thread.start()
+
+    def cancel_export(self):
+        if self.export_thread is not None:
+            self.cancel_export_btn.setEnabled(False)
+            self.export_status.setText("Cancelling...")
+            self.export_thread.cancel()
+
+    def export_progressed(self, done, total, fps, eta):
+        self.export_progress.setValue(min(done, total))
+        minutes, seconds = divmod(int(eta), 60)
+        self.export_status.setText(f"{done}/{total} frames, {fps:.1f} fps, ETA {minutes}:{seconds:02d}")
+
+    def export_done(self):
+        self.export_thread.wait()
+        self.export_thread = None
+        self.export_frame.hide()
+        self.apply_btn.setEnabled(True)
+        self.load_btn.setEnabled(True)
+
+    def export_finished(self, stats):
+        self.export_done()
+        details = str(stats)
+        if self.hud_check.isChecked():
+            details += "\n\nPer-frame times:\n" + stats.timing_summary()
+        QMessageBox.information(self, "Done", f"Video saved successfully!\n\n{details}")
+
+    def export_failed(self, message):
+        self.export_done()
+        QMessageBox.critical(self, "Error", f"Could not save video:\n{message}")
+
+    def export_cancelled(self):
+        self.export_done()
+
+    def closeEvent(self, event):
+        if self.export_thread is not None:
+            # Removes the partial output before the window goes away
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        self.timer.stop()
+        self.stop_prefetch()
+        if self.source is not None:
+            self.source.release()
+        event.accept()
@@ -0,0 +1,138 @@
+"""
+Mapping presets.
+
+Two formats are supported:
+
+- JSON (.json), for humans:
+      {"version": 1, "mappings": [{"lower": [b, g, r], "upper": [b, g, r], "color": [b, g, r]}]}
+
+- Compiled binary (.cmap), for batch workers. A little-endian header
+  (magic, version, flags, mapping count) is followed by 9 bytes per mapping
+  (lower, upper and new color as B/G/R bytes). When the LUT flag is set the
+  packed lookup table follows at LUT_OFFSET, so it can be memory-mapped
+  instead of compiled.
+"""
+import json
+import struct
+
+import numpy as np
+
+from color_engine import ColorTransformPipeline, LUT_SIZE, compile_lut, map_lut, normalize_mappings
+
+PRESET_VERSION = 1
+
+BINARY_MAGIC = b"VCCP"
+BINARY_HEADER = struct.Struct("<4sBBH")
+FLAG_HAS_LUT = 0x01
+
+# Page aligned, so the table can be mapped without touching the header
+LUT_OFFSET = 4096
+
+
+def mappings_to_dict(mappings):
+    return {
+        "version": PRESET_VERSION,
+        "mappings": [
+            {"lower": list(lower), "upper": list(upper), "color": list(new_color)}
+            for lower, upper, new_color in normalize_mappings(mappings)
+        ],
+    }
+
+
+def mappings_from_dict(data):
+    """
+    Reads mappings from a parsed preset. Colors are B/G/R triples of
+    integers in 0..255; anything else raises ValueError.
+    """
+    try:
+        entries = data["mappings"]
+        mappings = [(m["lower"], m["upper"], m["color"]) for m in entries]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed preset: {e}")
+    for mapping in mappings:
+        for color in mapping:
+            if (not isinstance(color, list) or len(color) != 3
+                    or not all(isinstance(v, int) and 0 <= v <= 255 for v in color)):
+                raise ValueError(f"Malformed preset color: {color!r}")
+    return normalize_mappings(mappings)
+
+
+def is_binary_preset(path):
+    with open(path, "rb") as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def save_preset(path, mappings):
+    with open(path, "w") as f:
+        json.dump(mappings_to_dict(mappings), f, indent=2)
+
+
+def save_binary_preset(path, mappings, lut=None, include_lut=True):
+    """
+    Writes mappings in the compiled binary format. With include_lut the
+    lookup table is embedded too (64 MB); pass lut to reuse an already
+    compiled table for the same mappings.
+    """
+    mappings = normalize_mappings(mappings)
+    if include_lut and mappings and lut is None:
+        lut = compile_lut(mappings)
+    has_lut = include_lut and lut is not None
+
+    with open(path, "wb") as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, PRESET_VERSION,
+                                   FLAG_HAS_LUT if has_lut else 0, len(mappings)))
+        for lower, upper, new_color in mappings:
+            f.write(bytes(lower + upper + new_color))
+        if has_lut:
+            f.seek(LUT_OFFSET)
+            np.asarray(lut, dtype='<u4').tofile(f)
+
+
+def read_binary_preset(path):
+    """Returns (mappings, lut) of a binary preset; lut is memory-mapped or None."""
+    with open(path, "rb") as f:
+        header = f.read(BINARY_HEADER.size)
+        if len(header) != BINARY_HEADER.size:
+            raise ValueError("Malformed preset: truncated header")
+        magic, version, flags, count = BINARY_HEADER.unpack(header)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Malformed preset: not a binary preset")
+        if version != PRESET_VERSION:
+            raise ValueError(f"Unsupported preset version: {version}")
+        body = f.read(9 * count)
+        if len(body) != 9 * count:
+            raise ValueError("Malformed preset: truncated mappings")
+        f.seek(0, 2)
+        size = f.tell()
+
+    mappings = normalize_mappings(
+        (body[i:i + 3], body[i + 3:i + 6], body[i + 6:i + 9]) for i in range(0, len(body), 9)
+    )
+    lut = None
+    if flags & FLAG_HAS_LUT and mappings:
+        if size < LUT_OFFSET + 4 * LUT_SIZE:
+            raise ValueError("Malformed preset: truncated lookup table")
+        lut = map_lut(path, LUT_OFFSET)
+    return mappings, lut
+
+
+def load_preset(path):
+    """Returns the mappings stored in a JSON or binary preset file."""
+    if is_binary_preset(path):
+        return read_binary_preset(path)[0]
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Malformed preset: {e}")
+    return mappings_from_dict(data)
+
+
+def load_pipeline(path):
+    """
+    Returns a ColorTransformPipeline for a preset file. A lookup table
+    embedded in a binary preset is memory-mapped rather than recompiled.
+    """
+    if is_binary_preset(path):
+        return ColorTransformPipeline(*read_binary_preset(path))
+    return ColorTransformPipeline(load_preset(path))
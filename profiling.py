@@ -0,0 +1,99 @@
+"""
+Lightweight per-stage timing of the hot paths: the player's frame loop
+and the export loop.
+
+Live timings are kept in rolling windows rather than running totals, so
+the percentiles describe how each stage behaves right now, for example
+while playback stutters, not averaged over the whole session. Export
+statistics keep every sample instead, as they describe a whole render.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+# Durations each histogram remembers; at 60 fps about four seconds
+TIMING_WINDOW = 256
+
+
+class RollingHistogram:
+    """
+    The last window durations (in seconds) of one stage, or all of them
+    with window=None, summarised as p50, p95 and max. Appending is
+    thread-safe, so threads running the same stage can share one.
+    """
+    def __init__(self, window=TIMING_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __str__(self):
+        if not self.samples:
+            return "no samples"
+        p50, p95, peak = self.summary()
+        return f"p50 {p50 * 1000:.1f} / p95 {p95 * 1000:.1f} / max {peak * 1000:.1f} ms"
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def merge(self, other):
+        self.samples.extend(other.samples)
+
+    def clear(self):
+        self.samples.clear()
+
+    def summary(self):
+        """Returns (p50, p95, max) in seconds, or zeros without samples."""
+        if not self.samples:
+            return 0.0, 0.0, 0.0
+        # list() copies in one step, even while another thread appends
+        samples = np.array(list(self.samples))
+        p50, p95 = np.percentile(samples, (50, 95))
+        return float(p50), float(p95), float(samples.max())
+
+
+class StageProfiler:
+    """
+    A RollingHistogram per named stage, for code that can switch timing on
+    and off while it runs.
+
+    Stages are timed with begin() and end(), which chain:
+
+        t = profiler.begin()
+        decode()
+        t = profiler.end("decode", t)
+        transform()
+        profiler.end("transform", t)
+
+    While disabled begin() returns None and end() returns at once, so the
+    instrumented path pays two calls per stage and never reads the clock.
+    """
+    def __init__(self, stages, window=TIMING_WINDOW):
+        self.enabled = False
+        self.timings = {stage: RollingHistogram(window) for stage in stages}
+
+    def begin(self):
+        return time.perf_counter() if self.enabled else None
+
+    def end(self, stage, began):
+        """Records the time since began under stage, and returns now (None while disabled)."""
+        if began is None:
+            return None
+        now = time.perf_counter()
+        self.timings[stage].add(now - began)
+        return now
+
+    def set_enabled(self, enabled):
+        # Timings from an earlier session would only blur the new one
+        if enabled and not self.enabled:
+            self.clear()
+        self.enabled = enabled
+
+    def clear(self):
+        for timing in self.timings.values():
+            timing.clear()
+
+    def report(self):
+        """One "stage: p50 / p95 / max" line per stage that has samples."""
+        return [f"{stage}: {timing}" for stage, timing in self.timings.items() if timing]
@@ -0,0 +1,620 @@
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+VideoInfo = namedtuple("VideoInfo", "path width height fps frame_count duration codec")
+
+DEFAULT_DECODER = "opencv"
+
+# Encoder settings of an export. encoder is "ffmpeg", "opencv" or "auto"
+# (ffmpeg when the binary is available); codec, preset and crf are passed
+# to ffmpeg, the OpenCV writer always writes OPENCV_FOURCC. threads=None
+# leaves the encoder thread count to ffmpeg.
+EncoderSettings = namedtuple("EncoderSettings", "encoder codec preset crf threads",
+                             defaults=("auto", "libx264", "veryfast", 20, None))
+
+ENCODER_PRESETS = {
+    "draft": EncoderSettings(codec="libx264", preset="ultrafast", crf=28),
+    "balanced": EncoderSettings(codec="libx264", preset="veryfast", crf=20),
+    "quality": EncoderSettings(codec="libx265", preset="medium", crf=18),
+    "lossless": EncoderSettings(codec="ffv1", preset=None, crf=None),
+    "opencv": EncoderSettings(encoder="opencv", codec=None, preset=None, crf=None),
+}
+DEFAULT_ENCODER_PRESET = "balanced"
+
+OPENCV_FOURCC = 'mp4v'
+
+# ffmpeg codecs that take -preset/-crf, and the pixel format written with them
+CRF_CODECS = ("libx264", "libx265")
+CODEC_PIX_FMTS = {"libx264": "yuv420p", "libx265": "yuv420p", "ffv1": "bgr0"}
+
+# ffmpeg codecs the MP4 muxer rejects, and the extension to write them with
+CODEC_EXTENSIONS = {"ffv1": ".mkv"}
+
+# Subtitles are copied as they are into Matroska; MP4/MOV only hold text
+# subtitles, converted to mov_text, and other containers get none
+SUBTITLE_COPY_CONTAINERS = (".mkv",)
+MOV_TEXT_CONTAINERS = (".mp4", ".m4v", ".mov")
+TEXT_SUBTITLE_CODECS = ("subrip", "ass", "ssa", "webvtt", "mov_text", "text")
+
+
+def find_ffmpeg():
+    return shutil.which("ffmpeg")
+
+
+def find_ffprobe():
+    return shutil.which("ffprobe")
+
+
+def fourcc_to_str(value):
+    value = int(value)
+    chars = [chr((value >> (8 * i)) & 0xFF) for i in range(4)]
+    return "".join(c for c in chars if c.isprintable()).strip()
+
+
+def read_info(cap, path):
+    # Queries the container once; later lookups go through the VideoInfo
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    duration = frame_count / fps if fps > 0 else 0.0
+    codec = fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC))
+    return VideoInfo(path, width, height, fps, frame_count, duration, codec)
+
+
+def probe(path):
+    """
+    Returns the VideoInfo of a video file without decoding any frames.
+    Raises IOError if the file cannot be opened.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Could not open video: {path}")
+        return read_info(cap, path)
+    finally:
+        cap.release()
+
+
+def stream_codecs(path):
+    """
+    Returns (codec_type, codec_name) of every stream in path, or None when
+    ffprobe is not available or the probe fails.
+    """
+    ffprobe = find_ffprobe()
+    if ffprobe is None:
+        return None
+    cmd = [ffprobe, "-v", "error", "-show_entries", "stream=codec_type,codec_name", "-of", "json", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        streams = json.loads(result.stdout)["streams"]
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError):
+        return None
+    return [(s.get("codec_type"), s.get("codec_name")) for s in streams]
+
+
+def video_format(path):
+    """
+    Returns (codec_name, pix_fmt) of the first video stream from ffprobe,
+    or from PyAV without it, or None when neither can tell.
+    """
+    ffprobe = find_ffprobe()
+    if ffprobe is not None:
+        cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "stream=codec_name,pix_fmt", "-of", "json", path]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            stream = json.loads(result.stdout)["streams"][0]
+            return stream.get("codec_name"), stream.get("pix_fmt")
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError):
+            return None
+    try:
+        import av
+    except ImportError:
+        return None
+    try:
+        with av.open(path) as container:
+            context = container.streams.video[0].codec_context
+            return context.name, context.pix_fmt
+    except (IndexError, av.error.FFmpegError):
+        return None
+
+
+def demux_keyframes(path):
+    """
+    Returns the keyframe indices of the first video stream by demuxing it
+    with PyAV (no decoding), or an empty list without PyAV.
+    """
+    try:
+        import av
+    except ImportError:
+        return []
+    try:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            # The final flush packet of demux() has no data
+            packets = (p for p in container.demux(stream) if p.size)
+            return [i for i, packet in enumerate(packets) if packet.is_keyframe]
+    except (IndexError, av.error.FFmpegError):
+        return []
+
+
+def passthrough_args(src_path, dst_path, input_index=1):
+    """
+    Returns the ffmpeg output options that copy the audio, subtitle and
+    metadata tracks of src_path (ffmpeg input number input_index) into
+    dst_path without re-encoding. Container metadata and chapters are
+    copied even when there are no tracks besides the video. The caller maps
+    the video stream itself.
+    """
+    codecs = stream_codecs(src_path)
+    if codecs is None:
+        # Unknown streams: copy whatever audio there is
+        audio, subtitles = True, []
+    else:
+        audio = any(codec_type == "audio" for codec_type, _ in codecs)
+        subtitles = [name for codec_type, name in codecs if codec_type == "subtitle"]
+
+    args = []
+    if audio:
+        args += ["-map", f"{input_index}:a?", "-c:a", "copy"]
+    if subtitles:
+        ext = os.path.splitext(dst_path)[1].lower()
+        if ext in SUBTITLE_COPY_CONTAINERS:
+            args += ["-map", f"{input_index}:s?", "-c:s", "copy"]
+        elif ext in MOV_TEXT_CONTAINERS and all(name in TEXT_SUBTITLE_CODECS for name in subtitles):
+            args += ["-map", f"{input_index}:s?", "-c:s", "mov_text"]
+    return args + ["-map_metadata", str(input_index), "-map_chapters", str(input_index)]
+
+
+class VideoSource:
+    """
+    A decoder that reads its stream metadata once on open and keeps track
+    of its own position.
+
+    read() returns None at the end of the stream, based on the decoder's
+    result rather than on the frame count the container reports. Decode
+    backends subclass this and implement decode_frame and seek_frame, and
+    optionally skip_frame and release.
+    """
+    name = None
+
+    def __init__(self, info):
+        self.info = info
+        self.position = 0
+        self.eof = False
+
+    @staticmethod
+    def available():
+        """Whether the package or binary this backend needs is installed."""
+        return True
+
+    @property
+    def frame_count(self):
+        return self.info.frame_count
+
+    @property
+    def fps(self):
+        return self.info.fps
+
+    @property
+    def size(self):
+        return self.info.width, self.info.height
+
+    @property
+    def duration(self):
+        return self.info.duration
+
+    def read(self):
+        """Decodes the frame at position and advances, or returns None at the end."""
+        frame = self.decode_frame()
+        if frame is None:
+            self.eof = True
+            return None
+        self.position += 1
+        return frame
+
+    def grab(self):
+        """Advances one frame without converting it. Returns False at the end."""
+        if not self.skip_frame():
+            self.eof = True
+            return False
+        self.position += 1
+        return True
+
+    def seek(self, index):
+        self.seek_frame(index)
+        self.position = index
+        self.eof = False
+
+    def release(self):
+        pass
+
+    def decode_frame(self):
+        """Returns the next frame as a writable BGR array, or None at the end."""
+        raise NotImplementedError
+
+    def skip_frame(self):
+        return self.decode_frame() is not None
+
+    def seek_frame(self, index):
+        raise NotImplementedError
+
+
+class OpenCVSource(VideoSource):
+    """
+    Decodes through cv2.VideoCapture. With threads set, the FFmpeg backend
+    is opened explicitly with that many decoder threads.
+    """
+    name = "opencv"
+
+    def __init__(self, path, threads=None):
+        if threads:
+            self.cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, threads])
+        else:
+            self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video: {path}")
+        super().__init__(read_info(self.cap, path))
+
+    def decode_frame(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def skip_frame(self):
+        return self.cap.grab()
+
+    def seek_frame(self, index):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVSource(VideoSource):
+    """
+    Decodes with PyAV (optional dependency), using FFmpeg's frame and slice
+    threading. Seeks go to the preceding keyframe and decode forward.
+    """
+    name = "pyav"
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("av") is not None
+
+    def __init__(self, path, threads=None):
+        import av
+
+        try:
+            self.container = av.open(path)
+        except av.error.FFmpegError as e:
+            raise IOError(f"Could not open video: {path} ({e})")
+        if not self.container.streams.video:
+            self.container.close()
+            raise IOError(f"No video stream: {path}")
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if threads:
+            self.stream.codec_context.thread_count = threads
+
+        fps = float(self.stream.average_rate or 0)
+        if self.stream.duration is not None:
+            duration = float(self.stream.duration * self.stream.time_base)
+        else:
+            duration = (self.container.duration or 0) / 1e6
+        frame_count = self.stream.frames or int(round(duration * fps))
+        super().__init__(VideoInfo(path, self.stream.codec_context.width, self.stream.codec_context.height,
+                                   fps, frame_count, duration, self.stream.codec_context.name))
+        self.frames = self.container.decode(self.stream)
+        self.pending = None
+
+    def next_av_frame(self):
+        if self.pending is not None:
+            frame, self.pending = self.pending, None
+            return frame
+        return next(self.frames, None)
+
+    def decode_frame(self):
+        frame = self.next_av_frame()
+        return frame.to_ndarray(format="bgr24") if frame is not None else None
+
+    def skip_frame(self):
+        return self.next_av_frame() is not None
+
+    def seek_frame(self, index):
+        start = self.stream.start_time or 0
+        target = start + int(round(index / self.fps / self.stream.time_base)) if self.fps else start
+        self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        self.frames = self.container.decode(self.stream)
+        self.pending = None
+        # Decode forward from the keyframe to the requested frame
+        for frame in self.frames:
+            if frame.pts is None or frame.pts >= target:
+                self.pending = frame
+                break
+
+    def release(self):
+        self.container.close()
+
+
+class FFmpegPipeSource(VideoSource):
+    """
+    Decodes in an ffmpeg subprocess that pipes raw BGR frames to stdout, so
+    decoding runs outside this process with ffmpeg's own threading. Seeking
+    restarts the subprocess at the frame's timestamp.
+    """
+    name = "ffmpeg"
+
+    @staticmethod
+    def available():
+        return find_ffmpeg() is not None
+
+    def __init__(self, path, threads=None):
+        self.ffmpeg = find_ffmpeg()
+        if self.ffmpeg is None:
+            raise IOError("ffmpeg was not found on the PATH")
+        super().__init__(probe(path))
+        self.path = path
+        self.threads = threads
+        self.frame_bytes = self.info.width * self.info.height * 3
+        self.process = None
+        self.start(0)
+
+    def start(self, index):
+        self.release()
+        cmd = [self.ffmpeg, "-v", "error", "-nostdin"]
+        if self.threads:
+            cmd += ["-threads", str(self.threads)]
+        if index and self.fps > 0:
+            cmd += ["-ss", f"{index / self.fps:.6f}"]
+        cmd += ["-i", self.path, "-map", "0:v:0", "-vsync", "passthrough",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read_bytes(self, buffer):
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(buffer):
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def decode_frame(self):
+        buffer = bytearray(self.frame_bytes)
+        if not self.read_bytes(buffer):
+            return None
+        return np.frombuffer(buffer, dtype=np.uint8).reshape(self.info.height, self.info.width, 3)
+
+    def seek_frame(self, index):
+        self.start(index)
+
+    def release(self):
+        if self.process is not None:
+            self.process.stdout.close()
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+DECODERS = {
+    OpenCVSource.name: OpenCVSource,
+    PyAVSource.name: PyAVSource,
+    FFmpegPipeSource.name: FFmpegPipeSource,
+}
+
+
+def open_source(path, decoder=DEFAULT_DECODER, threads=None):
+    """
+    Opens path with one of the DECODERS. threads sets the decoder thread
+    count (None leaves it to the backend). Raises IOError if the file
+    cannot be opened, ImportError if the backend's package is missing.
+    """
+    try:
+        backend = DECODERS[decoder]
+    except KeyError:
+        raise ValueError(f"Unknown decoder: {decoder}")
+    return backend(path, threads)
+
+
+def benchmark_decoders(path, decoders=None, threads=None, max_frames=None):
+    """
+    Decodes the same file with each backend and returns one result dict per
+    decoder with frames, seconds and fps, or error if it could not run.
+    unavailable is set along with error when the backend is not installed.
+    """
+    results = []
+    for decoder in decoders or DECODERS:
+        result = {"decoder": decoder, "threads": threads}
+        if not DECODERS[decoder].available():
+            result.update(error="not installed", unavailable=True)
+            results.append(result)
+            continue
+        try:
+            began = time.perf_counter()
+            source = open_source(path, decoder, threads)
+            try:
+                frames = 0
+                while max_frames is None or frames < max_frames:
+                    if source.read() is None:
+                        break
+                    frames += 1
+            finally:
+                source.release()
+            seconds = time.perf_counter() - began
+            result.update(frames=frames, seconds=seconds, fps=frames / seconds if seconds > 0 else 0.0)
+        except (IOError, ImportError, ValueError) as e:
+            result["error"] = str(e)
+        results.append(result)
+    return results
+
+
+class VideoWriter:
+    """
+    Encodes BGR frames of a fixed size into a file. Encoder backends
+    subclass this and implement write and release.
+
+    release() finishes the file and raises IOError if the encoder failed;
+    abort() stops without finishing it, for when the render itself failed.
+    Backends with supports_passthrough can copy tracks of the source file
+    into the output as they encode (see FFmpegWriter).
+    """
+    name = None
+    supports_passthrough = False
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def abort(self):
+        self.release()
+
+
+class OpenCVWriter(VideoWriter):
+    """Writes OPENCV_FOURCC through cv2.VideoWriter. Slow and large, but needs no ffmpeg."""
+    name = "opencv"
+
+    def __init__(self, path, fps, size, settings, passthrough=None):
+        # passthrough is not supported; callers copy the tracks afterwards
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*OPENCV_FOURCC), fps, size)
+        if not self.writer.isOpened():
+            raise IOError(f"Could not open video writer: {path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegWriter(VideoWriter):
+    """
+    Pipes raw BGR frames to an ffmpeg subprocess, which encodes them with
+    settings.codec on its own threads. Errors of the subprocess surface as
+    IOError with ffmpeg's message.
+
+    passthrough, if given, is (src_path, args) with args from
+    passthrough_args: the tracks they select are copied from src_path into
+    the same file while the video is encoded.
+    """
+    name = "ffmpeg"
+    supports_passthrough = True
+
+    def __init__(self, path, fps, size, settings, passthrough=None):
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None:
+            raise IOError("ffmpeg was not found on the PATH")
+        self.path = path
+        width, height = size
+        cmd = [ffmpeg, "-v", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+               "-r", f"{fps or 30:.6f}", "-i", "-"]
+        if passthrough is not None:
+            src_path, args = passthrough
+            cmd += ["-i", src_path, "-map", "0:v:0"] + list(args)
+        else:
+            cmd.append("-an")
+        cmd += ["-c:v", settings.codec]
+        if settings.codec in CRF_CODECS:
+            if settings.preset:
+                cmd += ["-preset", settings.preset]
+            if settings.crf is not None:
+                cmd += ["-crf", str(settings.crf)]
+        if settings.codec in CODEC_PIX_FMTS:
+            cmd += ["-pix_fmt", CODEC_PIX_FMTS[settings.codec]]
+        if settings.threads:
+            cmd += ["-threads", str(settings.threads)]
+        cmd.append(path)
+        # stderr goes to a file, so a chatty encoder can never fill a pipe and stall
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=self.log)
+
+    def error(self):
+        self.log.seek(0)
+        message = self.log.read().decode(errors="replace").strip()
+        return IOError(f"Encoding {self.path} failed: {message or 'ffmpeg exited early'}")
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self.process.wait()
+            raise self.error()
+
+    def release(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        self.process = None
+        try:
+            if returncode != 0:
+                raise self.error()
+        finally:
+            self.log.close()
+
+    def abort(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        self.process = None
+        self.log.close()
+
+
+ENCODERS = {
+    OpenCVWriter.name: OpenCVWriter,
+    FFmpegWriter.name: FFmpegWriter,
+}
+
+
+def resolve_encoder(settings=None):
+    """
+    Returns settings with the encoder resolved to a key of ENCODERS. None
+    means the DEFAULT_ENCODER_PRESET; "auto" falls back to the OpenCV writer
+    when there is no ffmpeg binary.
+    """
+    if settings is None:
+        settings = ENCODER_PRESETS[DEFAULT_ENCODER_PRESET]
+    if settings.encoder == "auto":
+        settings = settings._replace(encoder="ffmpeg" if find_ffmpeg() is not None else "opencv")
+    if settings.encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {settings.encoder}")
+    return settings
+
+
+def output_extension(settings=None):
+    """Returns the file extension of the container settings should be written to."""
+    settings = resolve_encoder(settings)
+    if settings.encoder == "ffmpeg":
+        return CODEC_EXTENSIONS.get(settings.codec, ".mp4")
+    return ".mp4"
+
+
+def open_writer(path, fps, size, settings=None, passthrough=None):
+    """
+    Opens a VideoWriter for path. Raises IOError if it cannot be opened.
+    passthrough is only honoured by writers with supports_passthrough.
+    """
+    settings = resolve_encoder(settings)
+    return ENCODERS[settings.encoder](path, fps, size, settings, passthrough)